@@ -6,8 +6,12 @@ until it is handled
 """
 
 from __future__ import annotations
+import asyncio
+import time
+import weakref
 from abc import ABC, abstractmethod
-from typing import Any, Optional
+from typing import (Any, Callable, Dict, FrozenSet, Iterable, Iterator, List,
+                    Optional, Tuple, Union)
 
 class Handler(ABC):
     """
@@ -25,39 +29,330 @@ class Handler(ABC):
 class AbstractHandler(Handler):
     """
     The default chaining behavior
+
+    handlers may declare the request keys they accept in `accepts`. the first
+    handler asked to handle a request compiles the chain behind it into a
+    dispatch table (key -> handler), so keyed requests are answered in constant time.
+    handlers that leave `accepts` as None are predicates and are still asked in order,
+    so the order of the chain always decides who wins.
+
+    handlers written the old way, overriding handle() and calling super().handle()
+    to pass the request on, still work: the plan asks them through handle() and stops there
     """
     _next_handler: Handler = None
+    accepts: Optional[FrozenSet[Any]] = None
+
+    _plan: Optional[_DispatchPlan] = None
+    # the compiled plans going through this handler, marked stale by set_next
+    _plans: Optional[weakref.WeakSet] = None
 
     def set_next(self, handler: Handler) -> Handler:
         self._next_handler = handler
+        if self._plans:
+            for plan in self._plans:
+                plan.stale = True
+            self._plans.clear()
         return handler
-    
+
+    def process(self, request: Any) -> Optional[str]:
+        """
+        handles the request locally, without passing it along the chain.
+        returning None lets the next handler have a go
+        """
+        return None
+
     def handle(self, request: Any) -> Optional[str]:
-        if self._next_handler:
-            return self._next_handler.handle(request)
-        
+        plan = self._plan
+        if plan is None or plan.stale:
+            # reached through super().handle() from an old style handler, the request moves on
+            plan = self._plan = _DispatchPlan(self, skip_head=_overrides_handle(self))
+        return plan.dispatch(request)
+
+def _overrides_handle(handler: Handler) -> bool:
+    return type(handler).handle is not AbstractHandler.handle
+
+class _DispatchPlan:
+    """
+    the chain starting at some handler, flattened once into a list,
+    with an index of keyed handlers and the positions of the predicate handlers.
+    `asks` holds what to call for every handler: process, or handle for the handlers
+    doing their own chaining
+    """
+
+    def __init__(self, head: Handler, skip_head: bool = False) -> None:
+        self.stale = False
+        self.chain: List[Handler] = []
+        self.asks: List[Callable[[Any], Optional[str]]] = []
+        self.index: Dict[Any, int] = {}
+        self.predicates: List[int] = []
+
+        handler, seen = head, set()
+        if skip_head:
+            self._register(head)
+            seen.add(id(head))
+            handler = head._next_handler
+        while handler is not None and id(handler) not in seen:
+            seen.add(id(handler))
+            position = len(self.chain)
+            self.chain.append(handler)
+            if not isinstance(handler, AbstractHandler) or _overrides_handle(handler):
+                # a foreign or old style handler does its own chaining, so it ends our plan
+                self.asks.append(handler.handle)
+                self.predicates.append(position)
+                break
+            self._register(handler)
+            self.asks.append(handler.process)
+            if handler.accepts is None:
+                self.predicates.append(position)
+            else:
+                for key in handler.accepts:
+                    # earlier handlers win
+                    self.index.setdefault(key, position)
+            handler = handler._next_handler
+
+    def _register(self, handler: AbstractHandler) -> None:
+        if handler._plans is None:
+            handler._plans = weakref.WeakSet()
+        handler._plans.add(self)
+
+    def dispatch(self, request: Any) -> Optional[str]:
+        try:
+            position = self.index.get(request)
+        except TypeError:
+            # unhashable requests can only be matched by predicates
+            position = None
+
+        # predicates placed before the keyed handler get the first chance
+        asks = self.asks
+        for predicate in self.predicates:
+            if position is not None and predicate > position:
+                break
+            result = asks[predicate](request)
+            if result is not None:
+                return result
+
+        if position is None:
+            return None
+        result = asks[position](request)
+        if result is not None:
+            return result
+        return self.walk(request, position + 1)
+
+    def walk(self, request: Any, start: int = 0) -> Optional[str]:
+        """
+        plain ordered traversal, used when a keyed handler declines its own key
+        """
+        for position in range(start, len(self.chain)):
+            accepts = getattr(self.chain[position], "accepts", None)
+            if accepts is not None and request not in accepts:
+                continue
+            result = self.asks[position](request)
+            if result is not None:
+                return result
         return None
 
-class MonkeyHandler(AbstractHandler):
+class HandlerStats:
+    """
+    how often a handler answered a request (hit), passed it on (miss),
+    and how many hops the requests it answered travelled to reach it
+    """
+
+    def __init__(self, handler: Handler) -> None:
+        self.handler = handler
+        self.hits = 0
+        self.misses = 0
+        self.hops = 0
+
+    def __repr__(self) -> str:
+        return (f'{type(self.handler).__name__}(hits={self.hits}, '
+                f'misses={self.misses}, hops={self.hops})')
+
+class ChainExecutor:
+    """
+    walks a chain with a loop instead of recursion, so the depth of the chain
+    never grows the stack. every request is asked to the handlers in order,
+    which lets the executor keep per-handler metrics for reordering hot handlers to the front
+    """
+
+    def __init__(self, head: Handler) -> None:
+        self._head = head
+        self._plan: Optional[_DispatchPlan] = None
+        self._steps: List[Tuple[Any, Callable[[Any], Optional[str]], HandlerStats]] = []
+        self._stats: Dict[int, HandlerStats] = {}
+
+    def _refresh(self) -> None:
+        if self._plan is not None and not self._plan.stale:
+            return
+        plan = _DispatchPlan(self._head)
+        steps = []
+        for handler, ask in zip(plan.chain, plan.asks):
+            stats = self._stats.get(id(handler))
+            if stats is None:
+                stats = self._stats[id(handler)] = HandlerStats(handler)
+            own = isinstance(handler, AbstractHandler) and not _overrides_handle(handler)
+            steps.append((handler.accepts if own else None, ask, stats))
+        self._steps = steps
+        self._plan = plan
+
     def handle(self, request: Any) -> Optional[str]:
+        self._refresh()
+        return self._run(request)
+
+    def handle_many(self, requests: Iterable[Any]) -> Iterator[Optional[str]]:
+        """
+        lazily yields one result per request, in order
+        """
+        self._refresh()
+        run = self._run
+        for request in requests:
+            yield run(request)
+
+    def _run(self, request: Any) -> Optional[str]:
+        for hops, (accepts, process, stats) in enumerate(self._steps):
+            if accepts is not None:
+                try:
+                    if request not in accepts:
+                        stats.misses += 1
+                        continue
+                except TypeError:
+                    stats.misses += 1
+                    continue
+            result = process(request)
+            if result is not None:
+                stats.hits += 1
+                stats.hops += hops
+                return result
+            stats.misses += 1
+        return None
+
+    def stats(self) -> List[HandlerStats]:
+        """
+        metrics of the handlers currently in the chain, in chain order
+        """
+        self._refresh()
+        return [stats for _, _, stats in self._steps]
+
+    def hot_order(self) -> List[Handler]:
+        """
+        the handlers of the chain sorted by hits, hottest first
+        """
+        return [stats.handler for stats in sorted(self.stats(), key=lambda s: -s.hits)]
+
+class AsyncHandler(ABC):
+    """
+    the async counterpart of Handler, for handlers that do I/O.
+    the next handler may be either an AsyncHandler or a plain Handler
+    """
+    @abstractmethod
+    def set_next(self, handler: Union[Handler, AsyncHandler]) -> Union[Handler, AsyncHandler]:
+        pass
+
+    @abstractmethod
+    async def handle(self, request) -> Optional[str]:
+        pass
+
+class AbstractAsyncHandler(AsyncHandler):
+    """
+    The default async chaining behavior. the chain is walked with a loop, and sync
+    handlers met on the way are run in a thread pool so they don't block the event loop
+    """
+    _next_handler: Union[Handler, AsyncHandler] = None
+    accepts: Optional[FrozenSet[Any]] = None
+
+    def set_next(self, handler: Union[Handler, AsyncHandler]) -> Union[Handler, AsyncHandler]:
+        self._next_handler = handler
+        return handler
+
+    async def process(self, request: Any) -> Optional[str]:
+        return None
+
+    async def handle(self, request: Any) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        handler = self
+        while handler is not None:
+            if isinstance(handler, (AbstractAsyncHandler, AbstractHandler)):
+                accepts = handler.accepts
+                try:
+                    skip = accepts is not None and request not in accepts
+                except TypeError:
+                    skip = True
+                if isinstance(handler, AbstractHandler) and _overrides_handle(handler):
+                    # an old style handler does its own chaining
+                    return await loop.run_in_executor(None, handler.handle, request)
+                if not skip:
+                    if isinstance(handler, AbstractAsyncHandler):
+                        result = await handler.process(request)
+                    else:
+                        result = await loop.run_in_executor(None, handler.process, request)
+                    if result is not None:
+                        return result
+                handler = handler._next_handler
+            elif isinstance(handler, AsyncHandler):
+                # foreign handlers do their own chaining
+                return await handler.handle(request)
+            else:
+                return await loop.run_in_executor(None, handler.handle, request)
+        return None
+
+async def async_client_code(handler: Union[Handler, AsyncHandler], requests: Iterable[Any],
+                            limit: int = 100) -> List[Optional[str]]:
+    """
+    handles many requests concurrently, with at most `limit` of them in flight
+    """
+    semaphore = asyncio.Semaphore(limit)
+    loop = asyncio.get_running_loop()
+
+    async def run(request: Any) -> Optional[str]:
+        async with semaphore:
+            if isinstance(handler, AsyncHandler):
+                return await handler.handle(request)
+            return await loop.run_in_executor(None, handler.handle, request)
+
+    return await asyncio.gather(*(run(request) for request in requests))
+
+class MonkeyHandler(AbstractHandler):
+    accepts = frozenset({'Banana'})
+
+    def process(self, request: Any) -> Optional[str]:
         if request == 'Banana':
             return f'Monkey: I will eat the {request}'
-        else:
-            return super().handle(request)
+        return None
 
 class SquirrelHandler(AbstractHandler):
-    def handle(self, request):
+    accepts = frozenset({'Nut'})
+
+    def process(self, request):
         if request == 'Nut':
             return f'Squirrel: I will eat the {request}'
-        else:
-            super().handle(request)
+        return None
 
 class DogHandler(AbstractHandler):
-    def handle(self, request):
+    accepts = frozenset({'MeatBall'})
+
+    def process(self, request):
         if request == 'MeatBall':
             return f'Dog: I will eat the request'
-        else:
-            return super().handle(request)
+        return None
+
+class SlowDogHandler(DogHandler):
+    """ a dog that has to fetch its food first """
+    def process(self, request):
+        time.sleep(0.001)
+        return super().process(request)
+
+class SlowCatHandler(AbstractHandler):
+    accepts = frozenset({'Fish'})
+
+    def process(self, request):
+        time.sleep(0.001)
+        return f'Cat: I will eat the {request}'
+
+class AsyncCatHandler(AbstractAsyncHandler):
+    accepts = frozenset({'Fish'})
+
+    async def process(self, request):
+        await asyncio.sleep(0.001)
+        return f'Cat: I will eat the {request}'
 
 def client_code(handler: Handler):
     for food in ["Nut", "Banana", "Cup of coffee"]:
@@ -78,7 +373,37 @@ def main():
     print("\n")
     print("Subchain: squirrel > dog")
     client_code(squirrel)
+    print("\n")
+
+    executor = ChainExecutor(monkey)
+    foods = ["Nut", "Banana", "MeatBall", "Nut", "Cup of coffee"] * 1000
+    handled = sum(1 for result in executor.handle_many(foods) if result)
+    print(f"Executor: handled {handled} of {len(foods)} requests")
+    for stats in executor.stats():
+        print(stats)
+
+
+def benchmark(requests: int = 1000) -> None:
+    """
+    the same I/O bound chain, once synchronous and once async
+    """
+    foods = ["Fish", "MeatBall", "Cup of coffee"] * (requests // 3)
+
+    sync_chain = SlowCatHandler()
+    sync_chain.set_next(SlowDogHandler())
+    start = time.perf_counter()
+    for food in foods:
+        sync_chain.handle(food)
+    sync_time = time.perf_counter() - start
+
+    async_chain = AsyncCatHandler()
+    async_chain.set_next(SlowDogHandler())
+    start = time.perf_counter()
+    asyncio.run(async_client_code(async_chain, foods, limit=len(foods)))
+    async_time = time.perf_counter() - start
 
+    print(f"sync chain:  {len(foods) / sync_time:10.0f} requests/s")
+    print(f"async chain: {len(foods) / async_time:10.0f} requests/s")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,303 @@
+# behavioral design pattern that turns a request into a stand-alone object
+# that contains all the information about the request
+
+# since a request is an object, it can be queued, merged with the next one,
+# run somewhere else and undone later
+
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+import threading
+
+class Command(ABC):
+    """
+    the command interface declares a method for executing a command, and one for undoing it
+    """
+
+    @abstractmethod
+    def execute(self) -> Any:
+        pass
+
+    @abstractmethod
+    def undo(self) -> None:
+        pass
+
+    def merge(self, following: Command) -> Optional[Command]:
+        """
+        returns one command doing the work of self followed by `following`,
+        or None when they can't be merged
+        """
+        return None
+
+    def key(self) -> Any:
+        """
+        commands with the same key execute in submission order, one batch at a time.
+        by default all commands share one key, so they are strictly ordered. a command
+        keyed by its receiver only waits for the commands of that receiver, and a key
+        of None means it may run alongside anything
+        """
+        return SERIAL
+
+# the key shared by commands that don't choose one
+SERIAL = object()
+
+class CommandStats:
+    """ counters of one type of command """
+
+    def __init__(self) -> None:
+        self.submitted = 0
+        self.merged = 0
+        self.executed = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def __repr__(self) -> str:
+        mean = self.total_latency / self.executed if self.executed else 0.0
+        return (f'CommandStats(submitted={self.submitted}, merged={self.merged}, '
+                f'executed={self.executed}, failed={self.failed}, busy={self.busy:.6f}s, '
+                f'mean_latency={mean:.6f}s, max_latency={self.max_latency:.6f}s)')
+
+def _run_batch(batch: List[Command]) -> List[Tuple[Command, Any, float, Optional[Exception]]]:
+    """
+    runs a batch in order, on whatever thread or process the executor picked
+    """
+    done = []
+    for command in batch:
+        start = perf_counter()
+        try:
+            done.append((command, command.execute(), perf_counter() - start, None))
+        except Exception as error:
+            done.append((command, None, perf_counter() - start, error))
+    return done
+
+class Invoker:
+    """
+    the invoker queues commands per key and runs them in batches of `batch_size`, merging
+    each new command into the one of the same key queued just before it when they allow it.
+    batches run inline, or on an executor with up to `max_in_flight` of them at once; batches
+    of the same key never overlap, so commands of one key execute in submission order.
+    the last `undo_limit` executed commands can be undone, most recently finished first,
+    and the last `results_limit` results are kept in `results`. commands that raise are
+    kept with their exception in `errors`.
+
+    on a process pool the commands (and their receivers) are pickled to the worker, so
+    only the results come back: it fits commands whose effect is what they return
+    """
+
+    def __init__(self, executor: Optional[Executor] = None, batch_size: int = 64,
+                 undo_limit: int = 100, max_in_flight: int = 4, results_limit: int = 100) -> None:
+        self._executor = executor
+        self._batch_size = batch_size
+        self._max_in_flight = max_in_flight if executor is not None else 1
+        # key -> the batch being filled
+        self._queues: Dict[Any, List[Tuple[Command, float]]] = {}
+        # full batches waiting for a slot, in the order they filled up
+        self._batches: Deque[Tuple[Any, List[Tuple[Command, float]]]] = deque()
+        self._waiting = 0
+        self._running: Set[Any] = set()
+        self._in_flight = 0
+        self._lock = threading.Condition()
+        self._history: Deque[Command] = deque(maxlen=undo_limit)
+        self.results: Deque[Any] = deque(maxlen=results_limit)
+        self.stats: Dict[str, CommandStats] = {}
+        # every command that raised, with its exception
+        self.errors: List[Tuple[Command, Exception]] = []
+        self.max_queue_depth = 0
+        self.max_running = 0
+
+    def _stats(self, command: Command) -> CommandStats:
+        name = type(command).__name__
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = CommandStats()
+        return stats
+
+    def submit(self, command: Command) -> None:
+        key = command.key()
+        with self._lock:
+            self._stats(command).submitted += 1
+            queue = self._queues.get(key)
+            if queue:
+                previous, queued = queue[-1]
+                merged = previous.merge(command)
+                if merged is not None:
+                    self._stats(command).merged += 1
+                    queue[-1] = (merged, queued)
+                    return
+            if queue is None:
+                queue = self._queues[key] = []
+            queue.append((command, perf_counter()))
+            self._waiting += 1
+            if self._waiting > self.max_queue_depth:
+                self.max_queue_depth = self._waiting
+            if len(queue) < self._batch_size:
+                return
+            self._batches.append((key, self._queues.pop(key)))
+        self._dispatch()
+
+    def _next_batch(self) -> Optional[Tuple[Any, List[Tuple[Command, float]]]]:
+        # called with the lock held: the oldest batch whose key has nothing running
+        if self._in_flight >= self._max_in_flight:
+            return None
+        for position, (key, batch) in enumerate(self._batches):
+            if key is None or key not in self._running:
+                del self._batches[position]
+                if key is not None:
+                    self._running.add(key)
+                self._in_flight += 1
+                self._waiting -= len(batch)
+                if self._in_flight > self.max_running:
+                    self.max_running = self._in_flight
+                return key, batch
+        return None
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._lock:
+                picked = self._next_batch()
+            if picked is None:
+                return
+            key, batch = picked
+            commands = [command for command, _ in batch]
+            if self._executor is None:
+                self._finish(key, batch, _run_batch(commands))
+            else:
+                future = self._executor.submit(_run_batch, commands)
+                future.add_done_callback(
+                    lambda future, key=key, batch=batch, commands=commands:
+                        self._done(key, batch, self._outcome(future, commands)))
+
+    def _outcome(self, future: Future,
+                 commands: List[Command]) -> List[Tuple[Command, Any, float, Optional[Exception]]]:
+        # a batch that could not run at all (say, a command that can't be pickled) fails as a whole
+        error = future.exception()
+        if error is not None:
+            return [(command, None, 0.0, error) for command in commands]
+        return future.result()
+
+    def _done(self, key: Any, batch: List[Tuple[Command, float]],
+              done: List[Tuple[Command, Any, float, Optional[Exception]]]) -> None:
+        self._finish(key, batch, done)
+        self._dispatch()
+
+    def _finish(self, key: Any, batch: List[Tuple[Command, float]],
+                done: List[Tuple[Command, Any, float, Optional[Exception]]]) -> None:
+        finished = perf_counter()
+        with self._lock:
+            for (_, queued), (command, result, seconds, error) in zip(batch, done):
+                stats = self._stats(command)
+                stats.busy += seconds
+                if error is not None:
+                    stats.failed += 1
+                    self.errors.append((command, error))
+                    continue
+                stats.executed += 1
+                latency = finished - queued
+                stats.total_latency += latency
+                if latency > stats.max_latency:
+                    stats.max_latency = latency
+                self._history.append(command)
+                self.results.append(result)
+            self._running.discard(key)
+            self._in_flight -= 1
+            self._lock.notify_all()
+
+    def flush(self) -> None:
+        """
+        runs what is queued, even partial batches, and waits until it is done
+        """
+        with self._lock:
+            self._batches.extend(self._queues.items())
+            self._queues.clear()
+        self._dispatch()
+        with self._lock:
+            self._lock.wait_for(lambda: not self._in_flight and not self._batches)
+
+    def undo(self) -> None:
+        self.flush()
+        with self._lock:
+            if not self._history:
+                return
+            command = self._history.pop()
+        command.undo()
+
+"""
+Concrete commands and their receiver
+"""
+
+class Counter:
+    """ the receiver """
+    def __init__(self) -> None:
+        self.value = 0
+
+class IncrementCommand(Command):
+    def __init__(self, counter: Counter, amount: int = 1) -> None:
+        self._counter = counter
+        self._amount = amount
+
+    def execute(self) -> int:
+        self._counter.value += self._amount
+        return self._counter.value
+
+    def undo(self) -> None:
+        self._counter.value -= self._amount
+
+    def merge(self, following: Command) -> Optional[Command]:
+        if isinstance(following, IncrementCommand) and following._counter is self._counter:
+            return IncrementCommand(self._counter, self._amount + following._amount)
+        return None
+
+    def key(self) -> Any:
+        # increments of different counters don't depend on each other
+        return self._counter
+
+class SquareSumCommand(Command):
+    """ a self contained command, its effect is its result """
+    def __init__(self, n: int) -> None:
+        self._n = n
+
+    def execute(self) -> int:
+        return sum(i * i for i in range(self._n))
+
+    def undo(self) -> None:
+        pass
+
+    def key(self) -> Any:
+        return None
+
+def main() -> None:
+    counter = Counter()
+    invoker = Invoker(batch_size=4)
+    for _ in range(10):
+        invoker.submit(IncrementCommand(counter))
+    invoker.flush()
+    print(f"Counter: {counter.value}")
+    # the ten increments were merged into one command
+    invoker.undo()
+    print(f"Counter after one undo: {counter.value}")
+
+    with ThreadPoolExecutor(max_workers=2) as threads:
+        invoker = Invoker(threads, batch_size=8)
+        for _ in range(100):
+            invoker.submit(IncrementCommand(counter))
+            invoker.submit(SquareSumCommand(100))
+        invoker.flush()
+    print(f"Counter after the thread pool: {counter.value}")
+
+    with ProcessPoolExecutor(max_workers=2) as processes:
+        invoker = Invoker(processes, batch_size=8)
+        for n in range(32):
+            invoker.submit(SquareSumCommand(10_000 + n))
+        invoker.flush()
+    print(f"Largest result from the process pool: {max(invoker.results)}, "
+          f"up to {invoker.max_running} batches at once")
+    for name, stats in invoker.stats.items():
+        print(f"{name}: {stats}")
+
+if __name__ == "__main__":
+    main()
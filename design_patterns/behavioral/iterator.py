@@ -5,7 +5,13 @@
 
 from __future__ import annotations
 from collections.abc import Iterable, Iterator
-from typing import Any, List
+import mmap
+import struct
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+from typing import Any, List, Optional, Tuple
 
 """
 to create an iterator in python, there are two abstract classes from the built-in collections
@@ -23,41 +29,372 @@ class AlphabeticalOrderIterator(Iterator):
     _position attribute stores the current traversal position. 
     An iterator may have a lot of other fields for storing iteration state,
     especially when it is supposed to work with a particular kind of collection
+
+    here the position is a (block, offset) pair into a SortedIndex, and the iterator
+    walks the half open range [start, stop) of positions, forwards or backwards
     """
 
-    _position: int = None
+    _position: Tuple[int, int] = None
     _reverse: bool = False
 
-    def __init__(self, collection: WordsCollection, reverse: bool = False) -> None:
-        self._collection = collection
+    def __init__(self, index: SortedIndex, reverse: bool = False,
+                 start: Tuple[int, int] = None, stop: Tuple[int, int] = None) -> None:
+        self._blocks = index._blocks
         self._reverse = reverse
-        self._position = - 1 if reverse else 0
-    
+        self._start = start if start is not None else (0, 0)
+        self._stop = stop if stop is not None else (len(self._blocks), 0)
+        self._position = self._stop if reverse else self._start
+
     def __next__(self):
-        try:
-            value = self._collection[self._position]
-            self._position += -1 if self._reverse else 1
-        except IndexError:
+        block, offset = self._position
+        if self._reverse:
+            if self._position <= self._start:
+                raise StopIteration()
+            if offset == 0:
+                block -= 1
+                offset = len(self._blocks[block])
+            offset -= 1
+            self._position = (block, offset)
+            return self._blocks[block][offset]
+
+        if self._position >= self._stop:
             raise StopIteration()
+        value = self._blocks[block][offset]
+        offset += 1
+        if offset == len(self._blocks[block]):
+            block, offset = block + 1, 0
+        self._position = (block, offset)
         return value
 
+class RangeIterator(Iterator):
+    """
+    iterates the items at alphabetical positions [start, stop) of a collection.
+    range iterators over disjoint ranges are independent of each other and can be pickled,
+    so each one can be handed to a different thread or process. a pickled iterator carries
+    its remaining items, or just the file path when the collection is mapped from a file
+    """
+
+    def __init__(self, index: Any, start: int, stop: int) -> None:
+        self._index = index
+        self._position = start
+        self._stop = stop
+        self._iterator = None
+
+    def __length_hint__(self) -> int:
+        return max(0, self._stop - self._position)
+
+    def _remaining(self) -> AlphabeticalOrderIterator:
+        return AlphabeticalOrderIterator(self._index, False,
+                                         self._index.locate(self._position),
+                                         self._index.locate(self._stop))
+
+    def __next__(self):
+        if self._position >= self._stop:
+            raise StopIteration()
+        if self._iterator is None:
+            self._iterator = self._remaining()
+        self._position += 1
+        return next(self._iterator)
+
+    def __getstate__(self) -> dict:
+        path = getattr(self._index, '_path', None)
+        if path is not None:
+            return {'path': path, 'start': self._position, 'stop': self._stop}
+        return {'items': list(self._remaining())}
+
+    def __setstate__(self, state: dict) -> None:
+        self._iterator = None
+        if 'path' in state:
+            self._index = CompactWords.open(state['path'])
+            self._position, self._stop = state['start'], state['stop']
+        else:
+            self._index = SortedIndex(state['items'])
+            self._position, self._stop = 0, len(state['items'])
+
+class SortedIndex:
+    """
+    a sorted list split into blocks of bounded size. inserting only shifts one block,
+    and the max of each block lets a lookup bisect the blocks first, then one block
+    """
+
+    _load: int = 1000
+
+    def __init__(self, items: Iterable[Any] = ()) -> None:
+        items = sorted(items)
+        load = self._load
+        self._blocks: List[List[Any]] = [items[i:i + load] for i in range(0, len(items), load)]
+        self._maxes: List[Any] = [block[-1] for block in self._blocks]
+
+    def __len__(self) -> int:
+        return sum(len(block) for block in self._blocks)
+
+    def add(self, item: Any) -> None:
+        blocks, maxes = self._blocks, self._maxes
+        if not blocks:
+            blocks.append([item])
+            maxes.append(item)
+            return
+        i = bisect_right(maxes, item)
+        if i == len(blocks):
+            i -= 1
+            blocks[i].append(item)
+            maxes[i] = item
+        else:
+            insort(blocks[i], item)
+        if len(blocks[i]) > 2 * self._load:
+            block = blocks[i]
+            blocks[i:i + 1] = [block[:self._load], block[self._load:]]
+            maxes[i:i + 1] = [block[self._load - 1], block[-1]]
+
+    def locate(self, position: int) -> Tuple[int, int]:
+        """
+        the (block, offset) of the item at a flat position
+        """
+        for block_number, block in enumerate(self._blocks):
+            if position < len(block):
+                return (block_number, position)
+            position -= len(block)
+        return (len(self._blocks), 0)
+
+    def bisect_left(self, item: Any) -> Tuple[int, int]:
+        i = bisect_left(self._maxes, item)
+        if i == len(self._blocks):
+            return (i, 0)
+        return (i, bisect_left(self._blocks[i], item))
+
+    def bisect_right(self, item: Any) -> Tuple[int, int]:
+        i = bisect_right(self._maxes, item)
+        if i == len(self._blocks):
+            return (i, 0)
+        return (i, bisect_right(self._blocks[i], item))
+
+class _SortedWords:
+    """
+    a read only sequence view of CompactWords in alphabetical order,
+    decoding a word only when it is indexed
+    """
+
+    def __init__(self, words: CompactWords) -> None:
+        self._words = words
+
+    def __len__(self) -> int:
+        return len(self._words._order)
+
+    def __getitem__(self, position: int) -> str:
+        return self._words[self._words._order[position]]
+
+class CompactWords:
+    """
+    words stored as one contiguous UTF-8 buffer plus an offsets array, instead of one
+    python str per word. word i is buffer[offsets[i]:offsets[i + 1]], and `_order` holds
+    the word ids in alphabetical order. it quacks like a SortedIndex with a single block,
+    so AlphabeticalOrderIterator walks it unchanged.
+
+    file layout written by save() and mapped by open():
+    header (magic, count, buffer size) | offsets | order | buffer
+    """
+
+    _magic: bytes = b'WORDS001'
+    _header = struct.Struct('=8sQQ')
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self._offsets = array('Q', [0])
+        self._order = array('Q')
+        self._mmap = None
+        self._path = None
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return str(self._buffer[self._offsets[i]:self._offsets[i + 1]], 'utf-8')
+
+    @property
+    def _blocks(self) -> List[_SortedWords]:
+        return [_SortedWords(self)] if len(self) else []
+
+    def locate(self, position: int) -> Tuple[int, int]:
+        return (0, position) if position < len(self) else (len(self._blocks), 0)
+
+    def bisect_left(self, word: str) -> Tuple[int, int]:
+        return (0, bisect_left(_SortedWords(self), word)) if len(self) else (0, 0)
+
+    def bisect_right(self, word: str) -> Tuple[int, int]:
+        return (0, bisect_right(_SortedWords(self), word)) if len(self) else (0, 0)
+
+    def _make_writable(self) -> None:
+        # a mapped file is read only, the first write copies it into memory
+        if self._mmap is None:
+            return
+        self._buffer = bytearray(self._buffer)
+        self._offsets = array('Q', self._offsets)
+        self._order = array('Q', self._order)
+        self._path = None
+        self.close()
+
+    def _encoded(self, i: int) -> bytearray:
+        return self._buffer[self._offsets[i]:self._offsets[i + 1]]
+
+    def add(self, word: str) -> None:
+        self._make_writable()
+        position = bisect_right(_SortedWords(self), word)
+        self._buffer += word.encode('utf-8')
+        self._offsets.append(len(self._buffer))
+        self._order.insert(position, len(self) - 1)
+
+    def add_many(self, words: Iterable[str]) -> None:
+        self._make_writable()
+        first = len(self)
+        encoded = [word.encode('utf-8') for word in words]
+        self._offsets.extend(accumulate(map(len, encoded), initial=len(self._buffer)))
+        # accumulate repeats the starting offset, which is already the last one stored
+        self._offsets.pop(first)
+        self._buffer += b''.join(encoded)
+        # utf-8 byte order is code point order, so only the new words are sorted, on their
+        # bytes, and their ids merged into the order of the words already stored
+        order, merged, start = self._order, array('Q'), 0
+        for i in sorted(range(len(encoded)), key=encoded.__getitem__):
+            position = bisect_right(order, encoded[i], start, key=self._encoded)
+            merged.extend(order[start:position])
+            merged.append(first + i)
+            start = position
+        merged.extend(order[start:])
+        self._order = merged
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as f:
+            f.write(self._header.pack(self._magic, len(self), len(self._buffer)))
+            f.write(memoryview(self._offsets).cast('B'))
+            f.write(memoryview(self._order).cast('B'))
+            f.write(self._buffer)
+
+    @classmethod
+    def open(cls, path: str) -> CompactWords:
+        words = cls()
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, size = cls._header.unpack_from(mapped)
+        if magic != cls._magic:
+            mapped.close()
+            raise ValueError(f'{path} is not a words file')
+        view = memoryview(mapped)
+        start = cls._header.size
+        offsets_end = start + 8 * (count + 1)
+        order_end = offsets_end + 8 * count
+        words._offsets = view[start:offsets_end].cast('Q')
+        words._order = view[offsets_end:order_end].cast('Q')
+        words._buffer = view[order_end:order_end + size]
+        words._mmap = mapped
+        words._path = path
+        return words
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            mapped, self._mmap = self._mmap, None
+            if isinstance(self._buffer, memoryview):
+                self.__init__()
+            mapped.close()
+
 class WordsCollection(Iterable):
     """
     Concrete collections provide one or several methods for retrieving fresh
     iterator instances, compatible with the collection class
+
+    next to the items in insertion order, the collection keeps a SortedIndex up to date
+    on every add_item, so alphabetical, prefix and range traversals never sort.
+    for corpora of words too big for python objects, the collection can instead be
+    backed by CompactWords, either in memory (compact=True) or mapped from a file with open()
     """
 
-    def __init__(self, collection: List[Any] = []) -> None:
-        self._collection = collection
+    def __init__(self, collection: Optional[List[Any]] = None, compact: bool = False) -> None:
+        if compact:
+            self._collection = None
+            self._index = CompactWords()
+            if collection:
+                self._index.add_many(collection)
+        else:
+            self._collection = list(collection) if collection is not None else []
+            self._index = SortedIndex(self._collection)
+
+    @classmethod
+    def open(cls, path: str) -> WordsCollection:
+        """
+        maps a file written by save(), words are only decoded when iterated
+        """
+        collection = cls.__new__(cls)
+        collection._collection = None
+        collection._index = CompactWords.open(path)
+        return collection
+
+    def save(self, path: str) -> None:
+        words = self._index
+        if not isinstance(words, CompactWords):
+            words = CompactWords()
+            words.add_many(self._collection)
+        words.save(path)
+
+    def close(self) -> None:
+        if isinstance(self._index, CompactWords):
+            self._index.close()
     
     def __iter__(self) -> AlphabeticalOrderIterator:
-        return AlphabeticalOrderIterator(self._collection)
+        return AlphabeticalOrderIterator(self._index)
     
     def get_reverse_iterator(self) -> AlphabeticalOrderIterator:
-        return AlphabeticalOrderIterator(self._collection, True)
+        return AlphabeticalOrderIterator(self._index, True)
+
+    def iter_prefix(self, prefix: str, reverse: bool = False) -> AlphabeticalOrderIterator:
+        """
+        the words starting with prefix, in alphabetical order
+        """
+        if not prefix:
+            return AlphabeticalOrderIterator(self._index, reverse)
+        # every word with the prefix sorts before the prefix with its last character bumped
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return AlphabeticalOrderIterator(self._index, reverse,
+                                         self._index.bisect_left(prefix),
+                                         self._index.bisect_left(upper))
+
+    def iter_range(self, low: Any, high: Any, reverse: bool = False) -> AlphabeticalOrderIterator:
+        """
+        the items from low (included) to high (excluded), in order
+        """
+        start = self._index.bisect_left(low)
+        stop = max(start, self._index.bisect_left(high))
+        return AlphabeticalOrderIterator(self._index, reverse, start, stop)
     
+    def chunks(self, size: int) -> List[RangeIterator]:
+        """
+        independent iterators over consecutive runs of `size` items, in alphabetical order
+        """
+        total = len(self._index)
+        return [RangeIterator(self._index, start, min(start + size, total))
+                for start in range(0, total, size)]
+
+    def shards(self, n: int) -> List[RangeIterator]:
+        """
+        n independent iterators over disjoint ranges of (almost) equal length
+        """
+        total = len(self._index)
+        bounds = [total * i // n for i in range(n + 1)]
+        return [RangeIterator(self._index, start, stop) for start, stop in zip(bounds, bounds[1:])]
+
     def add_item(self, item: Any):
-        self._collection.append(item)
+        if self._collection is not None:
+            self._collection.append(item)
+        self._index.add(item)
+
+    def add_items(self, items: Iterable[Any]) -> None:
+        if isinstance(self._index, CompactWords):
+            self._index.add_many(items)
+            return
+        for item in items:
+            self.add_item(item)
     
 def main():
     collections = WordsCollection()
@@ -69,7 +406,19 @@ def main():
     print("\n".join(collections))
     print("")
     print("Reverse Traversal: ")
-    print("\n".join(collections.get_reverse_iterator()), end="")
+    print("\n".join(collections.get_reverse_iterator()))
+    print("")
+    print("Words starting with 'S':")
+    print("\n".join(collections.iter_prefix("S")))
+    print("")
+    print("Shards counted in worker processes:")
+    shards = collections.shards(2)
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        for shard, count in zip(shards, executor.map(_count_items, shards)):
+            print(f"expected {shard.__length_hint__()}, counted {count}")
+
+def _count_items(items: Iterable[Any]) -> int:
+    return sum(1 for _ in items)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
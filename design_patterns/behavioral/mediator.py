@@ -7,7 +7,14 @@
 # a possible con is that a mediator object can evolve over time into a god object
 
 from __future__ import annotations
+import hashlib
+import threading
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import nullcontext
+from time import perf_counter
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
 
 class Mediator(ABC):
     """
@@ -20,21 +27,115 @@ class Mediator(ABC):
     def notify(self, sender: object, event: str) -> None:
         pass
 
-class ConcreteMediator(Mediator):
+class EventMediator(Mediator):
+    """
+    a mediator driven by a table of event -> handlers instead of an if/elif chain.
+    notify only queues the event, and the queue is drained in batches by the outermost
+    notify, so components calling back into the mediator don't recurse.
+    an event that is already pending is coalesced into the pending one
+    """
+
+    def __init__(self) -> None:
+        self._handlers: Dict[str, List[Callable[[object], None]]] = {}
+        # event -> [sender, time queued], in queue order
+        self._pending: Dict[str, list] = {}
+        self._draining = False
+        # a single thread drives this mediator, so the lock does nothing here
+        self._lock = nullcontext()
+        self.notified = 0
+        self.coalesced = 0
+        self.dispatched = 0
+        self.batches = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def register(self, event: str, handler: Callable[[object], None]) -> None:
+        self._handlers.setdefault(event, []).append(handler)
+
+    def unregister(self, event: str, handler: Callable[[object], None]) -> None:
+        self._handlers[event].remove(handler)
+
+    def notify(self, sender: object, event: str) -> None:
+        with self._lock:
+            self.notified += 1
+            pending = self._pending.get(event)
+            if pending is not None:
+                pending[0] = sender
+                self.coalesced += 1
+            else:
+                self._pending[event] = [sender, perf_counter()]
+            if self._draining:
+                return
+            self._draining = True
+        self.drain()
+
+    def drain(self) -> None:
+        """
+        dispatches the pending events until none is left. a failing handler doesn't stop
+        the others, the first exception is raised once everything was dispatched
+        """
+        failure = None
+        try:
+            while True:
+                with self._lock:
+                    batch, self._pending = self._pending, {}
+                    if not batch:
+                        self._draining = False
+                        self._idle()
+                        break
+                    self.batches += 1
+                for event, (sender, queued) in batch.items():
+                    latency = perf_counter() - queued
+                    self.total_latency += latency
+                    if latency > self.max_latency:
+                        self.max_latency = latency
+                    self.dispatched += 1
+                    for handler in self._handlers.get(event, ()):
+                        try:
+                            handler(sender)
+                        except Exception as error:
+                            if failure is None:
+                                failure = error
+        except BaseException:
+            with self._lock:
+                self._draining = False
+                self._idle()
+            raise
+        if failure is not None:
+            raise failure
+
+    def _idle(self) -> None:
+        # called with the lock held whenever the mediator may have gone quiet
+        pass
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'notified': self.notified,
+            'coalesced': self.coalesced,
+            'dispatched': self.dispatched,
+            'batches': self.batches,
+            'mean_latency': self.total_latency / self.dispatched if self.dispatched else 0.0,
+            'max_latency': self.max_latency,
+        }
+
+class ConcreteMediator(EventMediator):
     def __init__(self, component1: Component1, component2: Component2) -> None:
+        super().__init__()
         self._component1 = component1
         self._component2 = component2
         self._component1.mediator = self
         self._component2.mediator = self
+        self.register("A", self._react_on_a)
+        self.register("D", self._react_on_d)
     
-    def notify(self, sender: object, event: str) -> None:
-        if event == "A":
-            print("Mediator reacts on A and triggers following operations:")
-            self._component2.do_c()
-        elif event == "D":
-            print("Mediator reacts on D and triggers following operations:")
-            self._component1.do_b()
-            self._component2.do_c()
+    def _react_on_a(self, sender: object) -> None:
+        print("Mediator reacts on A and triggers following operations:")
+        self._component2.do_c()
+
+    def _react_on_d(self, sender: object) -> None:
+        print("Mediator reacts on D and triggers following operations:")
+        self._component1.do_b()
+        self._component2.do_c()
 
 class BaseComponent:
     """
@@ -77,6 +178,212 @@ class Component2(BaseComponent):
         print("Component2 does D")
         self.mediator.notify(self, "D")
 
+class _Lane:
+    """
+    runs the work of one component on an executor, one task at a time and in order
+    """
+
+    def __init__(self, mediator: ConcurrentMediator, component: BaseComponent,
+                 executor: Executor, owned: bool) -> None:
+        self._mediator = mediator
+        self.component = component
+        self.executor = executor
+        self.owned = owned
+        self._tasks: Deque[Tuple[Callable[[object], None], object]] = deque()
+        self._running = False
+
+    def submit(self, handler: Callable[[object], None], sender: object) -> None:
+        mediator = self._mediator
+        with mediator._lock:
+            mediator._inflight += 1
+            self._tasks.append((handler, sender))
+            if self._running:
+                return
+            self._running = True
+        self.executor.submit(self._run)
+
+    def _run(self) -> None:
+        mediator = self._mediator
+        while True:
+            with mediator._lock:
+                if not self._tasks:
+                    self._running = False
+                    return
+                handler, sender = self._tasks.popleft()
+            try:
+                handler(sender)
+            except Exception as error:
+                mediator.errors.append((self.component, error))
+            finally:
+                with mediator._lock:
+                    mediator._inflight -= 1
+                    mediator._idle()
+
+class _Routed:
+    """
+    a handler that runs on the lane of its component, when that component is bound
+    """
+
+    def __init__(self, mediator: ConcurrentMediator, component: BaseComponent,
+                 handler: Callable[[object], None]) -> None:
+        self._mediator = mediator
+        self._component = component
+        self._handler = handler
+
+    def __call__(self, sender: object) -> None:
+        lane = self._mediator._lanes.get(id(self._component))
+        if lane is None:
+            self._handler(sender)
+        else:
+            lane.submit(self._handler, sender)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, _Routed):
+            return self._handler == other._handler
+        return self._handler == other
+
+class ConcurrentMediator(EventMediator):
+    """
+    an EventMediator whose components can each be bound to their own worker thread,
+    or share a pool. notify hands the work of a bound component to its lane and moves on,
+    so a slow component only delays itself. work for one component still runs in the
+    order it was notified. flush() waits until no event or task is left
+
+    events are never coalesced here, since the payload of an event is its sender:
+    every notify is dispatched. each thread drains the events it notified itself,
+    so handlers of unbound components run on the thread that notified
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._lock = threading.Condition()
+        self._lanes: Dict[int, _Lane] = {}
+        self._local = threading.local()
+        # events notified and not dispatched yet, over all the threads
+        self._queued = 0
+        self._inflight = 0
+        self.errors: List[Tuple[BaseComponent, Exception]] = []
+
+    def bind(self, component: BaseComponent, executor: Optional[Executor] = None) -> None:
+        """
+        runs the handlers of component on executor, or on a dedicated worker thread
+        """
+        owned = executor is None
+        if owned:
+            executor = ThreadPoolExecutor(max_workers=1,
+                                          thread_name_prefix=type(component).__name__)
+        self._lanes[id(component)] = _Lane(self, component, executor, owned)
+        component.mediator = self
+
+    def register(self, event: str, handler: Callable[[object], None],
+                 component: Optional[BaseComponent] = None) -> None:
+        """
+        handlers that are methods of a component belong to it, others can name their component
+        """
+        if component is None:
+            owner = getattr(handler, '__self__', None)
+            if isinstance(owner, BaseComponent):
+                component = owner
+        if component is not None:
+            handler = _Routed(self, component, handler)
+        super().register(event, handler)
+
+    def notify(self, sender: object, event: str) -> None:
+        local = self._local
+        queue = getattr(local, 'queue', None)
+        if queue is None:
+            queue = local.queue = deque()
+        with self._lock:
+            self.notified += 1
+            self._queued += 1
+        queue.append((event, sender, perf_counter()))
+        if not getattr(local, 'draining', False):
+            self.drain()
+
+    def drain(self) -> None:
+        """
+        dispatches the events queued by the calling thread. a failing handler doesn't stop
+        the others, the first exception is raised once the queue is empty
+        """
+        local = self._local
+        queue = getattr(local, 'queue', None)
+        if not queue:
+            return
+        local.draining = True
+        failure = None
+        try:
+            with self._lock:
+                self.batches += 1
+            while queue:
+                event, sender, queued = queue.popleft()
+                latency = perf_counter() - queued
+                with self._lock:
+                    self._queued -= 1
+                    self.dispatched += 1
+                    self.total_latency += latency
+                    if latency > self.max_latency:
+                        self.max_latency = latency
+                for handler in self._handlers.get(event, ()):
+                    try:
+                        handler(sender)
+                    except Exception as error:
+                        if failure is None:
+                            failure = error
+        finally:
+            local.draining = False
+            with self._lock:
+                self._idle()
+        if failure is not None:
+            raise failure
+
+    def _busy(self) -> bool:
+        return bool(self._queued or self._inflight)
+
+    def _idle(self) -> None:
+        if not self._busy():
+            self._lock.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        waits until every event is dispatched and every component is done with its work
+        """
+        with self._lock:
+            return self._lock.wait_for(lambda: not self._busy(), timeout)
+
+    def join(self) -> None:
+        """
+        flushes, then stops the worker threads the mediator created
+        """
+        self.flush()
+        for lane in self._lanes.values():
+            if lane.owned:
+                lane.executor.shutdown()
+
+class HashComponent(BaseComponent):
+    """ hashing releases the GIL, so several of these can run at once """
+    def __init__(self, name: str, mediator: Mediator = None) -> None:
+        super().__init__(mediator)
+        self.name = name
+        self.digests: List[str] = []
+
+    def on_data(self, sender: object) -> None:
+        self.digests.append(hashlib.sha256(sender).hexdigest()[:12])
+        self.mediator.notify(self, "hashed")
+
+def benchmark(events: int = 100_000) -> None:
+    mediator = EventMediator()
+    counter = [0]
+
+    def count(sender: object) -> None:
+        counter[0] += 1
+
+    mediator.register("tick", count)
+    start = perf_counter()
+    for _ in range(events):
+        mediator.notify(None, "tick")
+    elapsed = perf_counter() - start
+    print(f"{events / elapsed:.0f} events/s, {mediator.stats()}")
+
 if __name__ == "__main__":
     c1 = Component1()
     c2 = Component2()
@@ -87,4 +394,23 @@ if __name__ == "__main__":
     print("\n", end="")
 
     print("Client triggers operation D")
-    c2.do_d()
\ No newline at end of file
+    c2.do_d()
+
+    print("\n", end="")
+    print(mediator.stats())
+    benchmark()
+
+    print("\n", end="")
+    concurrent = ConcurrentMediator()
+    hashers = [HashComponent(f"hasher{i}") for i in range(4)]
+    pool = ThreadPoolExecutor(max_workers=4)
+    for hasher in hashers:
+        concurrent.bind(hasher, pool)
+        concurrent.register("data", hasher.on_data)
+    start = perf_counter()
+    for i in range(16):
+        concurrent.notify(bytes([i]) * 4_000_000, "data")
+    concurrent.join()
+    pool.shutdown()
+    print(f"Hashed in {perf_counter() - start:.3f}s: {[hasher.digests[-1] for hasher in hashers]}")
+    print(f"Digests per hasher: {[len(hasher.digests) for hasher in hashers]}, {concurrent.stats()}")
\ No newline at end of file
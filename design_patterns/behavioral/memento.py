@@ -3,9 +3,16 @@
 
 from __future__ import annotations
 from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right
 from datetime import datetime
+import mmap
+import os
 from random import sample
 from string import ascii_letters, digits
+from typing import List, Optional, Tuple, Union
+import struct
+import tempfile
+import zlib
 
 class Originator():
     """
@@ -46,9 +53,9 @@ class Memento(ABC):
         pass
 
 class ConcreteMemento(Memento):
-    def __init__(self, state: str) -> None:
+    def __init__(self, state: str, date: Optional[str] = None) -> None:
         self._state = state
-        self._date = str(datetime.now())[:19]
+        self._date = date if date is not None else str(datetime.now())[:19]
     
     def get_state(self) -> str:
         return self._state
@@ -89,6 +96,303 @@ class Caretaker():
         for memento in self._mementos:
             print(memento.get_name())
 
+class _HistoryEntry:
+    """
+    one memento in a DeltaCaretaker. a full entry stores the state itself, a delta entry
+    stores how to get it from the previous entry: (kept prefix, kept suffix, new middle)
+    """
+    __slots__ = ('date', 'full', 'prefix', 'suffix', 'payload', 'compressed')
+
+    def __init__(self, date: str, full: bool, payload: str, prefix: int = 0, suffix: int = 0) -> None:
+        self.date = date
+        self.full = full
+        self.prefix = prefix
+        self.suffix = suffix
+        self.payload: Union[str, bytes] = payload
+        self.compressed = False
+
+    def text(self) -> str:
+        if self.compressed:
+            return zlib.decompress(self.payload).decode('utf-8')
+        return self.payload
+
+    def size(self) -> int:
+        return len(self.payload)
+
+    def compress(self) -> None:
+        if not self.compressed:
+            self.payload = zlib.compress(self.payload.encode('utf-8'))
+            self.compressed = True
+
+    def apply(self, previous: str) -> str:
+        if self.full:
+            return self.text()
+        return previous[:self.prefix] + self.text() + previous[len(previous) - self.suffix:]
+
+def _delta(old: str, new: str) -> Tuple[int, int, str]:
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    limit -= prefix
+    while suffix < limit and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    return prefix, suffix, new[prefix:len(new) - suffix]
+
+class DeltaCaretaker():
+    """
+    a caretaker for originators with large states. every `snapshot_every`-th memento keeps
+    the full state, the ones in between only keep a delta to the previous memento.
+    the history is capped by number of entries and / or payload bytes, evicting the oldest
+    first, and entries older than the `hot` most recent ones can be compressed.
+    undo rebuilds a state from the nearest full snapshot before it.
+
+    unlike Caretaker it needs the state of a memento, so it relies on get_state()
+    """
+
+    def __init__(self, originator: Originator, snapshot_every: int = 16,
+                 max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 compress_cold: bool = False, hot: int = 4) -> None:
+        self._originator = originator
+        self._entries: List[_HistoryEntry] = []
+        self._snapshot_every = snapshot_every
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._compress_cold = compress_cold
+        self._hot = hot
+        self._bytes = 0
+        # state of the last entry, so backups can diff against it without a rebuild
+        self._tip: Optional[str] = None
+        # entries since the last full snapshot
+        self._since_snapshot = 0
+
+    def backup(self) -> None:
+        print("Caretaker: Saving originator's state...")
+        memento = self._originator.save()
+        state = memento.get_state()
+        if self._tip is None or self._since_snapshot + 1 >= self._snapshot_every:
+            entry = _HistoryEntry(memento.get_date(), True, state)
+            self._since_snapshot = 0
+        else:
+            prefix, suffix, middle = _delta(self._tip, state)
+            entry = _HistoryEntry(memento.get_date(), False, middle, prefix, suffix)
+            self._since_snapshot += 1
+        self._entries.append(entry)
+        self._bytes += entry.size()
+        self._tip = state
+
+        if self._compress_cold and len(self._entries) > self._hot:
+            cold = self._entries[-self._hot - 1]
+            if not cold.compressed:
+                self._bytes -= cold.size()
+                cold.compress()
+                self._bytes += cold.size()
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = self._entries
+        while len(entries) > 1 and (
+                (self._max_entries is not None and len(entries) > self._max_entries) or
+                (self._max_bytes is not None and self._bytes > self._max_bytes)):
+            oldest = entries[0]
+            following = entries[1]
+            if not following.full:
+                # the next entry becomes the snapshot its successors are rebuilt from
+                state = following.apply(oldest.text())
+                self._bytes -= following.size()
+                entries[1] = _HistoryEntry(following.date, True, state)
+                if following.compressed:
+                    entries[1].compress()
+                self._bytes += entries[1].size()
+            del entries[0]
+            self._bytes -= oldest.size()
+
+    def _state_at(self, index: int) -> str:
+        start = index
+        while not self._entries[start].full:
+            start -= 1
+        state = self._entries[start].text()
+        for entry in self._entries[start + 1:index + 1]:
+            state = entry.apply(state)
+        return state
+
+    def undo(self) -> None:
+        while self._entries:
+            entry = self._entries.pop()
+            self._bytes -= entry.size()
+            state = self._tip
+            self._tip = self._state_at(len(self._entries) - 1) if self._entries else None
+            self._since_snapshot = 0
+            for since, previous in enumerate(reversed(self._entries)):
+                if previous.full:
+                    self._since_snapshot = since
+                    break
+            memento = ConcreteMemento(state, entry.date)
+            print(f'Caretaker: Restoring state to: {memento.get_name()}')
+            try:
+                self._originator.restore(memento)
+                return
+            except Exception:
+                continue
+
+    def size(self) -> Tuple[int, int]:
+        """
+        number of entries and payload bytes currently kept
+        """
+        return len(self._entries), self._bytes
+
+    def show_history(self) -> None:
+        print("Caretaker: Here is the list of mementos:")
+        state = None
+        for entry in self._entries:
+            state = entry.apply(state)
+            print(ConcreteMemento(state, entry.date).get_name())
+
+class _LogIndex:
+    """
+    the side index of a PersistentCaretaker: one fixed size (timestamp, offset, length) record
+    per memento. records on disk are read straight from a memory map, records appended since
+    the file was opened are kept in a list. it is a sequence of timestamps, so bisect works on it
+    """
+
+    _record = struct.Struct('=qQQ')
+
+    def __init__(self, path: str) -> None:
+        self._mmap = None
+        self._mapped = 0
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        # a crash can leave a partial record at the end, which is ignored
+        size -= size % self._record.size
+        if size:
+            with open(path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+            self._mapped = size // self._record.size
+        self._tail: List[Tuple[int, int, int]] = []
+
+    def __len__(self) -> int:
+        return self._mapped + len(self._tail)
+
+    def __getitem__(self, i: int) -> int:
+        return self.record(i)[0]
+
+    def record(self, i: int) -> Tuple[int, int, int]:
+        if i < self._mapped:
+            return self._record.unpack_from(self._mmap, i * self._record.size)
+        return self._tail[i - self._mapped]
+
+    def append(self, record: Tuple[int, int, int]) -> bytes:
+        self._tail.append(record)
+        return self._record.pack(*record)
+
+    def truncate(self, count: int) -> None:
+        # drops records whose payload never made it to the log
+        if count < self._mapped:
+            self._mapped = count
+            self._tail = []
+        else:
+            del self._tail[count - self._mapped:]
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+def _timestamp(date: str) -> int:
+    return int(datetime.strptime(date, '%Y-%m-%d %H:%M:%S').timestamp())
+
+class PersistentCaretaker():
+    """
+    a caretaker that appends every memento to a log on disk, next to an index of
+    (timestamp, offset, length) records, so the history survives the process.
+    reopening only maps the index, and payloads are read when a memento is restored.
+    restore_at and restore find their memento with a binary search on the timestamps,
+    which relies on mementos being appended in date order.
+
+    undo walks back through the log without erasing it, so point in time restores still see
+    every memento ever saved
+    """
+
+    def __init__(self, originator: Originator, path: str) -> None:
+        self._originator = originator
+        self._path = path
+        self._index = _LogIndex(path + '.idx')
+        self._log = open(path, 'a+b')
+        log_size = self._log.seek(0, os.SEEK_END)
+        while len(self._index):
+            _, offset, length = self._index.record(len(self._index) - 1)
+            if offset + length <= log_size:
+                break
+            self._index.truncate(len(self._index) - 1)
+        self._index_file = open(path + '.idx', 'ab')
+        self._index_file.truncate(len(self._index) * _LogIndex._record.size)
+        # mementos at or after this position have been undone
+        self._head = len(self._index)
+
+    def backup(self) -> None:
+        print("Caretaker: Saving originator's state...")
+        memento = self._originator.save()
+        payload = memento.get_date().encode('ascii') + memento.get_state().encode('utf-8')
+        offset = self._log.seek(0, os.SEEK_END)
+        self._log.write(payload)
+        self._log.flush()
+        self._index_file.write(self._index.append((_timestamp(memento.get_date()), offset, len(payload))))
+        self._index_file.flush()
+        self._head = len(self._index)
+
+    def _load(self, i: int) -> ConcreteMemento:
+        _, offset, length = self._index.record(i)
+        self._log.seek(offset)
+        payload = self._log.read(length)
+        return ConcreteMemento(payload[19:].decode('utf-8'), payload[:19].decode('ascii'))
+
+    def _restore(self, i: int) -> None:
+        memento = self._load(i)
+        print(f'Caretaker: Restoring state to: {memento.get_name()}')
+        self._originator.restore(memento)
+
+    def undo(self) -> None:
+        while self._head:
+            self._head -= 1
+            try:
+                self._restore(self._head)
+                return
+            except Exception:
+                continue
+
+    def restore_at(self, when: datetime) -> None:
+        """
+        restores the latest memento saved at or before `when`
+        """
+        i = bisect_right(self._index, int(when.timestamp())) - 1
+        if i < 0:
+            raise LookupError(f'no memento saved before {when}')
+        self._restore(i)
+
+    def restore(self, name: str) -> None:
+        """
+        restores the memento with the given name, as shown by show_history
+        """
+        timestamp = _timestamp(name[:19])
+        for i in range(bisect_left(self._index, timestamp), bisect_right(self._index, timestamp)):
+            if self._load(i).get_name() == name:
+                self._restore(i)
+                return
+        raise LookupError(f'no memento named {name}')
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def show_history(self) -> None:
+        print("Caretaker: Here is the list of mementos:")
+        for i in range(len(self._index)):
+            print(self._load(i).get_name())
+
+    def close(self) -> None:
+        self._index.close()
+        self._index_file.close()
+        self._log.close()
+
 if __name__ == "__main__":
     originator = Originator("Super duper")
     caretaker = Caretaker(originator)
@@ -109,4 +413,28 @@ if __name__ == "__main__":
     caretaker.undo()
 
     print("Rollback once more. \n")
-    caretaker.undo()
\ No newline at end of file
+    caretaker.undo()
+
+    print()
+    originator = Originator("x" * 60)
+    caretaker = DeltaCaretaker(originator, snapshot_every=4, max_entries=6, compress_cold=True)
+    for _ in range(10):
+        caretaker.backup()
+        originator._state = originator._state[:20] + originator._generate_random_string(5) + originator._state[25:]
+    entries, size = caretaker.size()
+    print(f"DeltaCaretaker: keeping {entries} mementos in {size} bytes")
+    caretaker.undo()
+
+    print()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'history.log')
+        caretaker = PersistentCaretaker(originator, path)
+        caretaker.backup()
+        originator.do_something()
+        caretaker.backup()
+        caretaker.close()
+
+        reopened = PersistentCaretaker(originator, path)
+        print(f"PersistentCaretaker: reopened a log of {len(reopened)} mementos")
+        reopened.restore_at(datetime.now())
+        reopened.close()
\ No newline at end of file
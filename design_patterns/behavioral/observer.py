@@ -2,8 +2,21 @@
 
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from random import randrange
-from typing import List
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from random import random, randrange
+from time import monotonic, perf_counter, sleep
+from typing import AbstractSet, Any, Deque, Dict, List, Optional, Tuple, Union
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+import hashlib
+import os
+import pickle
+import threading
+import weakref
 
 class Subject(ABC):
     """
@@ -31,6 +44,181 @@ class Subject(ABC):
         '''
         pass
 
+class _Range:
+    """ a node of the interval treap: one bounded range interest """
+    __slots__ = ('low', 'high', 'order', 'ref', 'priority', 'left', 'right', 'max_high')
+
+    def __init__(self, low: Any, high: Any, order: int, ref: weakref.ref) -> None:
+        self.low = low
+        self.high = high
+        self.order = order
+        self.ref = ref
+        self.priority = random()
+        self.left: Optional[_Range] = None
+        self.right: Optional[_Range] = None
+        self.max_high = high
+
+    def update(self) -> None:
+        high = self.high
+        if self.left is not None and self.left.max_high > high:
+            high = self.left.max_high
+        if self.right is not None and self.right.max_high > high:
+            high = self.right.max_high
+        self.max_high = high
+
+def _rotate_right(node: _Range) -> _Range:
+    top = node.left
+    node.left, top.right = top.right, node
+    node.update()
+    top.update()
+    return top
+
+def _rotate_left(node: _Range) -> _Range:
+    top = node.right
+    node.right, top.left = top.left, node
+    node.update()
+    top.update()
+    return top
+
+def _insert(root: Optional[_Range], node: _Range) -> _Range:
+    if root is None:
+        return node
+    if (node.low, node.order) < (root.low, root.order):
+        root.left = _insert(root.left, node)
+        if root.left.priority > root.priority:
+            return _rotate_right(root)
+    else:
+        root.right = _insert(root.right, node)
+        if root.right.priority > root.priority:
+            return _rotate_left(root)
+    root.update()
+    return root
+
+def _remove(root: Optional[_Range], low: Any, order: int) -> Optional[_Range]:
+    if root is None:
+        return None
+    if (low, order) < (root.low, root.order):
+        root.left = _remove(root.left, low, order)
+    elif (low, order) > (root.low, root.order):
+        root.right = _remove(root.right, low, order)
+    elif root.left is None:
+        return root.right
+    elif root.right is None:
+        return root.left
+    elif root.left.priority > root.right.priority:
+        root = _rotate_right(root)
+        root.right = _remove(root.right, low, order)
+    else:
+        root = _rotate_left(root)
+        root.left = _remove(root.left, low, order)
+    root.update()
+    return root
+
+class _InterestIndex:
+    """
+    the observers of a subject indexed by their interest, so finding the ones matching a
+    state doesn't look at the others, in memory linear in the number of observers:
+    - observers without interest, or with a range unbounded on both sides, always match
+    - set interests go in a dict topic -> observers
+    - ranges open on one side sit in a list sorted by their bound, the matching ones are
+      a prefix (low, None) or a suffix (None, high) found with one bisect
+    - bounded ranges live in a treap ordered by their low bound, where every node knows the
+      highest high bound under it, so subtrees ending before the state are skipped
+    attach and detach update the index in place
+    """
+
+    def __init__(self) -> None:
+        self._everyone: Dict[int, weakref.ref] = {}
+        self._topics: Dict[Any, Dict[int, weakref.ref]] = {}
+        # (low, order, ref) and (high, order, ref), sorted
+        self._from: List[Tuple[Any, int, weakref.ref]] = []
+        self._until: List[Tuple[Any, int, weakref.ref]] = []
+        self._ranges: Optional[_Range] = None
+        self._interests: Dict[int, Any] = {}
+        # attach order, so observers found in different places are notified in that order
+        self._order: Dict[int, int] = {}
+        self._attached = 0
+
+    def add(self, key: int, ref: weakref.ref, interest: Any) -> None:
+        order = self._attached
+        self._attached += 1
+        self._interests[key] = interest
+        self._order[key] = order
+        if isinstance(interest, tuple):
+            low, high = interest
+            if low is not None and high is not None:
+                self._ranges = _insert(self._ranges, _Range(low, high, order, ref))
+            elif low is not None:
+                insort(self._from, (low, order, ref))
+            elif high is not None:
+                insort(self._until, (high, order, ref))
+            else:
+                self._everyone[key] = ref
+        elif interest is None:
+            self._everyone[key] = ref
+        else:
+            for topic in interest:
+                self._topics.setdefault(topic, {})[key] = ref
+
+    def remove(self, key: int) -> None:
+        if key not in self._interests:
+            return
+        interest = self._interests.pop(key)
+        order = self._order.pop(key)
+        if isinstance(interest, tuple) and interest != (None, None):
+            low, high = interest
+            if low is not None and high is not None:
+                self._ranges = _remove(self._ranges, low, order)
+            else:
+                entries, bound = (self._from, low) if low is not None else (self._until, high)
+                del entries[bisect_left(entries, (bound, order))]
+        elif interest is None or isinstance(interest, tuple):
+            del self._everyone[key]
+        else:
+            for topic in interest:
+                observers = self._topics[topic]
+                del observers[key]
+                if not observers:
+                    del self._topics[topic]
+
+    def match(self, state: Any) -> List[weakref.ref]:
+        # (attach order, ref) of every match outside _everyone
+        found: List[Tuple[int, weakref.ref]] = []
+        try:
+            topic = self._topics.get(state)
+        except TypeError:
+            # unhashable states can't be topics
+            topic = None
+        if topic:
+            order = self._order
+            found.extend((order[key], ref) for key, ref in topic.items())
+        if self._from:
+            stop = bisect_right(self._from, state, key=_first)
+            found.extend((order, ref) for _, order, ref in self._from[:stop])
+        if self._until:
+            start = bisect_right(self._until, state, key=_first)
+            found.extend((order, ref) for _, order, ref in self._until[start:])
+        if self._ranges is not None:
+            stack = [self._ranges]
+            while stack:
+                node = stack.pop()
+                if node is None or not state < node.max_high:
+                    continue
+                stack.append(node.left)
+                if node.low <= state:
+                    if state < node.high:
+                        found.append((node.order, node.ref))
+                    stack.append(node.right)
+        if not found:
+            return list(self._everyone.values())
+        order = self._order
+        found.extend((order[key], ref) for key, ref in self._everyone.items())
+        found.sort(key=_first)
+        return [ref for _, ref in found]
+
+def _first(entry: Tuple[Any, ...]) -> Any:
+    return entry[0]
+
 class ConcreteSubject(Subject):
     """
     the subject owns some important state and notifies observers when the state changes
@@ -38,44 +226,373 @@ class ConcreteSubject(Subject):
 
     _state : int = None
 
-    _observers: List[Observer] = []
-    """
-    list of subscribers. in real life, the list of subscribers can be stored more comprehensively.
-    """
+    def __init__(self) -> None:
+        self._observers: Dict[int, weakref.ref] = {}
+        """
+        subscribers by id, held through weak references so that an observer nobody else uses
+        detaches itself. a dict keeps attach order and makes detach O(1)
+        """
+        self._index = _InterestIndex()
+        """
+        the subscribers by interest, read once when they attach
+        """
 
     def attach(self, observer: Observer) -> None:
-        self._observers.append(observer)
+        key = id(observer)
+        if key in self._observers:
+            self._forget(key)
+        subject = weakref.ref(self)
+
+        def forget(_: weakref.ref) -> None:
+            alive = subject()
+            if alive is not None:
+                alive._forget(key)
+
+        ref = weakref.ref(observer, forget)
+        self._observers[key] = ref
+        self._index.add(key, ref, getattr(observer, 'interest', None))
     
     def detach(self, observer: Observer) -> None:
-        self._observers.remove(observer)
+        if id(observer) not in self._observers:
+            raise KeyError(id(observer))
+        self._forget(id(observer))
+
+    def _forget(self, key: int) -> None:
+        # detach, or the observer was garbage collected
+        self._observers.pop(key, None)
+        self._index.remove(key)
     
     def notify(self) -> None:
-        for observer in self._observers:
-            observer.update(self)
+        for ref in self._matching():
+            observer = ref()
+            if observer is not None:
+                observer.update(self)
+
+    def _matching(self) -> List[weakref.ref]:
+        return self._index.match(self._state)
     
     def some_business_logic(self):
         self._state = randrange(0, 10)
         print(f'Subject: My state has changed to: {self._state}')
         self.notify()
 
+def _matches(interest: Any, state: Any) -> bool:
+    if interest is None:
+        return True
+    if isinstance(interest, tuple):
+        low, high = interest
+        return (low is None or state >= low) and (high is None or state < high)
+    return state in interest
+
 class Observer(ABC):
     """
     the observer interface declares the update method, used by subjects
+
+    an observer can declare the states it cares about in `interest`: a (low, high) range
+    where either bound may be None, or a set of states (topics). subjects only
+    notify observers whose interest matches their state. the interest is read on attach
     """
+    interest: Union[None, Tuple[Any, Any], AbstractSet[Any]] = None
+
     @abstractmethod
     def update(self, subject: Subject) -> None:
         pass
 
 class ConcreteObserverA(Observer):
+    interest = (None, 3)
+
     def update(self, subject: Subject) -> None:
         if subject._state < 3:
             print("ConcreteObserverA: Reacted to the event")
 
 class ConcreteObserverB(Observer):
+    interest = (2, None)
+
     def update(self, subject: Subject) -> None:
         if subject._state >= 2:
             print("ConcreteObserverB: Reacted to the event")
 
+class StateSnapshot:
+    """
+    what a queued observer receives instead of the subject: the state at the time of
+    the notification, which the subject may have moved on from since
+    """
+    __slots__ = ('subject', '_state', 'published')
+
+    def __init__(self, subject: Subject, state: Any, published: float) -> None:
+        self.subject = subject
+        self._state = state
+        self.published = published
+
+class Mailbox:
+    """
+    the bounded queue of snapshots waiting for one observer, and its delivery metrics.
+    an update that raises is counted in `errors` and delivery goes on with the next snapshot.
+    when it is full, the overflow policy decides what happens to a new snapshot:
+    'block' makes the publisher wait, 'drop-oldest' discards the oldest one and
+    'coalesce' replaces the newest queued snapshot, so the observer skips to the latest state
+    """
+
+    policies = ('block', 'drop-oldest', 'coalesce')
+
+    def __init__(self, observer: Observer, executor: Executor, maxsize: int, policy: str) -> None:
+        if maxsize < 1:
+            raise ValueError(f'a mailbox holds at least one snapshot, got maxsize={maxsize}')
+        self._observer = weakref.ref(observer)
+        self._executor = executor
+        self._maxsize = maxsize
+        self._policy = policy
+        self._queue: Deque[StateSnapshot] = deque()
+        self._changed = threading.Condition()
+        self._running = False
+        self.delivered = 0
+        self.errors = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def put(self, snapshot: StateSnapshot) -> None:
+        with self._changed:
+            if len(self._queue) >= self._maxsize:
+                if self._policy == 'block':
+                    self._changed.wait_for(lambda: len(self._queue) < self._maxsize)
+                elif self._policy == 'drop-oldest':
+                    self._queue.popleft()
+                    self.dropped += 1
+                else:
+                    self._queue[-1] = snapshot
+                    self.coalesced += 1
+                    return
+            self._queue.append(snapshot)
+            if self._running:
+                return
+            self._running = True
+        self._executor.submit(self._deliver)
+
+    def _deliver(self) -> None:
+        try:
+            while True:
+                with self._changed:
+                    if not self._queue:
+                        self._running = False
+                        self._changed.notify_all()
+                        return
+                    snapshot = self._queue.popleft()
+                    self._changed.notify_all()
+                observer = self._observer()
+                if observer is None:
+                    continue
+                self.lag = perf_counter() - snapshot.published
+                if self.lag > self.max_lag:
+                    self.max_lag = self.lag
+                try:
+                    observer.update(snapshot)
+                except Exception:
+                    # a failing update only costs its own snapshot
+                    self.errors += 1
+                else:
+                    self.delivered += 1
+        except BaseException:
+            with self._changed:
+                self._running = False
+                self._changed.notify_all()
+            raise
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        with self._changed:
+            return self._changed.wait_for(lambda: not self._queue and not self._running, timeout)
+
+class QueuedSubject(ConcreteSubject):
+    """
+    a subject that never calls its observers itself. notify puts a snapshot of the state
+    in the mailbox of each interested observer and returns, the mailboxes are delivered on
+    a thread pool. with the 'block' policy a full mailbox still holds the publisher up,
+    the other policies keep notify cheap whatever the observers do
+    """
+
+    def __init__(self, executor: Optional[Executor] = None, maxsize: int = 64,
+                 policy: str = 'drop-oldest') -> None:
+        if policy not in Mailbox.policies:
+            raise ValueError(f'unknown overflow policy {policy!r}, expected one of {Mailbox.policies}')
+        if maxsize < 1:
+            raise ValueError(f'a mailbox holds at least one snapshot, got maxsize={maxsize}')
+        super().__init__()
+        self._owns_executor = executor is None
+        self._executor = executor if executor is not None else ThreadPoolExecutor()
+        self._maxsize = maxsize
+        self._policy = policy
+        self._mailboxes: Dict[int, Mailbox] = {}
+
+    def attach(self, observer: Observer) -> None:
+        super().attach(observer)
+        self._mailboxes[id(observer)] = Mailbox(observer, self._executor, self._maxsize, self._policy)
+
+    def _forget(self, key: int) -> None:
+        super()._forget(key)
+        # also runs when the observer is garbage collected
+        self._mailboxes.pop(key, None)
+
+    def mailbox(self, observer: Observer) -> Mailbox:
+        return self._mailboxes[id(observer)]
+
+    def notify(self) -> None:
+        snapshot = StateSnapshot(self, self._state, perf_counter())
+        mailboxes = self._mailboxes
+        for ref in self._matching():
+            mailbox = mailboxes.get(id(ref()))
+            if mailbox is not None:
+                mailbox.put(snapshot)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        waits until every queued snapshot has been delivered, at most `timeout` seconds in all
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        for mailbox in list(self._mailboxes.values()):
+            remaining = None if deadline is None else max(0.0, deadline - monotonic())
+            if not mailbox.join(remaining):
+                return False
+        return True
+
+    def close(self) -> None:
+        self.flush()
+        if self._owns_executor:
+            self._executor.shutdown()
+
+def _encode_batch(states: List[Any]) -> bytes:
+    # a batch of ints travels as a raw array, anything else is pickled
+    try:
+        return b'q' + array('q', states).tobytes()
+    except (TypeError, OverflowError):
+        return b'p' + pickle.dumps(states, pickle.HIGHEST_PROTOCOL)
+
+def _decode_batch(data: bytes) -> List[Any]:
+    if data[:1] == b'q':
+        return array('q', data[1:]).tolist()
+    return pickle.loads(data[1:])
+
+def _serve_observer(connection: Connection, observer_class: type, args: tuple) -> None:
+    """
+    the loop of a worker process: hosts one observer and feeds it every received batch,
+    until an empty message says the subject is closing. replies with the number of updates
+    """
+    observer = observer_class(*args)
+    delivered = 0
+    while True:
+        data = connection.recv_bytes()
+        if not data:
+            break
+        states = _decode_batch(data)
+        for state in states:
+            observer.update(StateSnapshot(None, state, 0.0))
+        delivered += len(states)
+    connection.send(delivered)
+    connection.close()
+
+class _RemoteObserver:
+    """ the publisher side of an observer living in a worker process """
+
+    def __init__(self, process: BaseProcess, connection: Connection, interest: Any) -> None:
+        self.process = process
+        self.connection = connection
+        self.interest = interest
+        self.batch: List[Any] = []
+
+class ProcessSubject(ConcreteSubject):
+    """
+    a subject that can also publish to observers living in worker processes, over a pipe
+    per worker: no broker, just the machine. states are buffered per worker and sent
+    in batches of `batch_size`, packed as a raw array when they are ints.
+    a remote observer gets a StateSnapshot without its subject, and its class (with
+    the constructor arguments) has to be picklable
+    """
+
+    def __init__(self, batch_size: int = 1024) -> None:
+        super().__init__()
+        self._batch_size = batch_size
+        self._remotes: List[_RemoteObserver] = []
+
+    def attach_remote(self, observer_class: type, *args: Any) -> None:
+        ours, theirs = Pipe()
+        process = Process(target=_serve_observer, args=(theirs, observer_class, args), daemon=True)
+        process.start()
+        theirs.close()
+        self._remotes.append(_RemoteObserver(process, ours, getattr(observer_class, 'interest', None)))
+
+    def notify(self) -> None:
+        super().notify()
+        state = self._state
+        for remote in self._remotes:
+            if _matches(remote.interest, state):
+                remote.batch.append(state)
+                if len(remote.batch) >= self._batch_size:
+                    self._send(remote)
+
+    def _send(self, remote: _RemoteObserver) -> None:
+        remote.connection.send_bytes(_encode_batch(remote.batch))
+        remote.batch = []
+
+    def flush(self) -> None:
+        """ sends the partial batches """
+        for remote in self._remotes:
+            if remote.batch:
+                self._send(remote)
+
+    def close(self) -> List[int]:
+        """
+        flushes, stops the workers and returns how many updates each of them handled
+        """
+        self.flush()
+        delivered = []
+        for remote in self._remotes:
+            remote.connection.send_bytes(b'')
+            delivered.append(remote.connection.recv())
+            remote.connection.close()
+            remote.process.join()
+        self._remotes = []
+        return delivered
+
+class HashingObserver(Observer):
+    """ a cpu heavy observer """
+    def __init__(self, rounds: int = 50) -> None:
+        self.rounds = rounds
+        self.digest = b''
+
+    def update(self, subject: Subject) -> None:
+        digest = str(subject._state).encode()
+        for _ in range(self.rounds):
+            digest = hashlib.sha256(digest).digest()
+        self.digest = digest
+
+def benchmark(states: int = 100_000, workers: Tuple[int, ...] = (1, 4, os.cpu_count() or 1)) -> None:
+    """
+    delivered updates per second with 1, 4 and one worker process per core
+    """
+    for count in sorted(set(workers)):
+        subject = ProcessSubject()
+        for _ in range(count):
+            subject.attach_remote(HashingObserver)
+        start = perf_counter()
+        for state in range(states):
+            subject._state = state
+            subject.notify()
+        delivered = sum(subject.close())
+        elapsed = perf_counter() - start
+        print(f"{count:3d} worker processes: {delivered / elapsed:12.0f} updates/s")
+
+class SlowObserver(Observer):
+    def __init__(self) -> None:
+        self.seen: List[int] = []
+
+    def update(self, subject: Subject) -> None:
+        sleep(0.01)
+        self.seen.append(subject._state)
+
 def main():
     subject = ConcreteSubject()
     observer_a = ConcreteObserverA()
@@ -87,6 +604,23 @@ def main():
     subject.detach(observer_a)
     subject.some_business_logic()
 
+    print()
+    queued = QueuedSubject(maxsize=4, policy='coalesce')
+    slow = SlowObserver()
+    queued.attach(slow)
+    start = perf_counter()
+    for state in range(100):
+        queued._state = state
+        queued.notify()
+    print(f"QueuedSubject: published 100 states in {perf_counter() - start:.4f}s")
+    queued.close()
+    mailbox = queued.mailbox(slow)
+    print(f"SlowObserver: saw {slow.seen[-1]} last, delivered {mailbox.delivered}, "
+          f"coalesced {mailbox.coalesced}, max lag {mailbox.max_lag:.4f}s")
+
+    print()
+    benchmark(states=20_000)
+
 
 if __name__ == "__main__":
     main()
@@ -2,4 +2,201 @@
 # lets an object alter its behavior when its internal state changes
 # used to convert massive switch base state machines into objects
 
+# one object per state is easy to read, but on a hot stream of events every event
+# costs a method call on the current state object. a state machine engine can keep the
+# declaration as classes and compile it into an integer transition table instead
 
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from array import array
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional, Sequence, Type, Union
+
+"""
+1. the classic approach: a context that delegates every event to its current state object
+"""
+
+class State(ABC):
+    @property
+    def context(self) -> Context:
+        return self._context
+
+    @context.setter
+    def context(self, context: Context) -> None:
+        self._context = context
+
+    @abstractmethod
+    def handle(self, event: str) -> None:
+        pass
+
+class Context:
+    """
+    the context holds a reference to the current state and lets it handle the events
+    """
+    _state: State = None
+
+    def __init__(self, state: State) -> None:
+        self.transition_to(state)
+
+    def transition_to(self, state: State) -> None:
+        self._state = state
+        self._state.context = self
+
+    def handle(self, event: str) -> None:
+        self._state.handle(event)
+
+class LockedState(State):
+    def handle(self, event: str) -> None:
+        if event == 'coin':
+            self.context.transition_to(UnlockedState())
+
+class UnlockedState(State):
+    def handle(self, event: str) -> None:
+        if event == 'push':
+            self.context.transition_to(LockedState())
+
+"""
+2. the table driven approach: states are declared as classes with a transition table,
+and a StateMachine compiles them into one flat array
+"""
+
+class MachineState:
+    """
+    a state of a StateMachine. `transitions` maps an event to the next state, given as
+    a class or its name. events missing from it leave the state unchanged.
+    on_enter and on_exit are only called for the states that define them
+    """
+    transitions: Dict[str, Union[str, Type[MachineState]]] = {}
+
+    def on_enter(self, machine: StateMachine) -> None:
+        pass
+
+    def on_exit(self, machine: StateMachine) -> None:
+        pass
+
+class StateMachine:
+    """
+    compiles the states into an array indexed by state * events + event. the array holds
+    the offset of the next state's row rather than its number, so stepping is a single
+    index: `row = table[row + event]`. events are numbered in the order they first appear
+    """
+
+    def __init__(self, states: Sequence[Type[MachineState]],
+                 initial: Optional[Type[MachineState]] = None) -> None:
+        self.states: List[MachineState] = [state() for state in states]
+        numbers = {state: number for number, state in enumerate(states)}
+        numbers.update({state.__name__: number for number, state in enumerate(states)})
+
+        self.events: Dict[str, int] = {}
+        for state in states:
+            for event in state.transitions:
+                self.events.setdefault(event, len(self.events))
+        width = max(len(self.events), 1)
+        self._width = width
+
+        table = array('l', [0]) * (len(states) * width)
+        for number, state in enumerate(states):
+            row = number * width
+            for event in range(width):
+                table[row + event] = row
+            for event, target in state.transitions.items():
+                table[row + self.events[event]] = numbers[target] * width
+        self._table = table
+
+        self._enters = [type(state).on_enter is not MachineState.on_enter for state in self.states]
+        self._exits = [type(state).on_exit is not MachineState.on_exit for state in self.states]
+        self._hooks = any(self._enters) or any(self._exits)
+        self._row = numbers[initial if initial is not None else states[0]] * width
+
+    @property
+    def state(self) -> MachineState:
+        return self.states[self._row // self._width]
+
+    def encode(self, events: Iterable[str]) -> array:
+        """
+        turns event names into event numbers once, so a stream can be fed many times.
+        the numbers take a byte each when there are at most 256 events
+        """
+        typecode = 'B' if len(self.events) <= 256 else 'l'
+        return array(typecode, [self.events[event] for event in events])
+
+    def _valid(self, events: Union[array, bytes]) -> bool:
+        if not events:
+            return True
+        if not isinstance(events, array) or events.typecode == 'B':
+            # deleting the known numbers has to leave nothing, done in C over the bytes
+            return not bytes(events).translate(None, bytes(range(min(len(self.events), 256))))
+        return min(events) >= 0 and max(events) < len(self.events)
+
+    def feed(self, events: Union[Iterable[str], array, bytes]) -> MachineState:
+        """
+        runs a stream of events, either names or the numbers returned by encode,
+        and returns the state the machine ends in. hooks see the machine already in the
+        state being entered, and a hook that raises leaves it where the stream got to
+        """
+        if not isinstance(events, (array, bytes, bytearray)):
+            events = self.encode(events)
+        elif not self._valid(events):
+            # an unknown number would silently index into the row of another state
+            raise ValueError(f'event numbers must be between 0 and {len(self.events) - 1}')
+        table, row = self._table, self._row
+        if not self._hooks:
+            for event in events:
+                row = table[row + event]
+            self._row = row
+        else:
+            width, enters, exits = self._width, self._enters, self._exits
+            for event in events:
+                following = table[row + event]
+                if following != row:
+                    if exits[row // width]:
+                        self.states[row // width].on_exit(self)
+                    self._row = row = following
+                    if enters[row // width]:
+                        self.states[row // width].on_enter(self)
+        return self.state
+
+class Locked(MachineState):
+    transitions = {'coin': 'Unlocked'}
+
+class Unlocked(MachineState):
+    transitions = {'push': 'Locked'}
+
+class CountingLocked(Locked):
+    transitions = {'coin': 'CountingUnlocked'}
+
+class CountingUnlocked(Unlocked):
+    """ an unlocked state with an entry hook """
+    transitions = {'push': 'CountingLocked'}
+    entries = 0
+
+    def on_enter(self, machine: StateMachine) -> None:
+        CountingUnlocked.entries += 1
+
+def benchmark(events: int = 1_000_000) -> None:
+    stream = ['coin', 'push', 'push', 'coin', 'coin', 'push'] * (events // 6)
+
+    context = Context(LockedState())
+    start = perf_counter()
+    for event in stream:
+        context.handle(event)
+    naive = perf_counter() - start
+
+    machine = StateMachine([Locked, Unlocked])
+    encoded = machine.encode(stream)
+    start = perf_counter()
+    machine.feed(encoded)
+    table = perf_counter() - start
+
+    print(f"state objects: {len(stream) / naive:12.0f} events/s")
+    print(f"state table:   {len(stream) / table:12.0f} events/s")
+
+def main() -> None:
+    machine = StateMachine([CountingLocked, CountingUnlocked])
+    print(f"Machine starts in {type(machine.state).__name__}")
+    state = machine.feed(['coin', 'coin', 'push', 'coin'])
+    print(f"Machine ends in {type(state).__name__}, unlocked {CountingUnlocked.entries} times")
+    benchmark()
+
+if __name__ == "__main__":
+    main()
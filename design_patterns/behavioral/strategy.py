@@ -0,0 +1,157 @@
+# behavioral design pattern that defines a family of algorithms,
+# puts each of them into a separate class and makes them interchangeable
+
+# the context doesn't know which strategy it uses, so it can pick one at runtime.
+# here the context picks by itself: it times the strategies on the real inputs
+# and keeps the fastest one for every input size
+
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+class Strategy(ABC):
+    """
+    the strategy interface declares the operation common to all versions of the algorithm
+    """
+    @abstractmethod
+    def execute(self, data: Any) -> Any:
+        pass
+
+class AdaptiveContext:
+    """
+    a context holding several strategies for the same operation. inputs are grouped in
+    buckets by size (powers of two). the first `samples` calls of a bucket run every
+    strategy on the input and time it, then the fastest one is chosen for the bucket.
+    every `recheck_every` calls a bucket is sampled again, in case the costs moved.
+
+    strategies more than `prune_factor` times slower than the best one in a bucket
+    are not tried on bigger inputs anymore, so a quadratic strategy is only timed while it is cheap.
+    when every strategy is pruned for a bucket, the best one of the closest smaller bucket is kept.
+    a recheck keeps the pruning: a pruned strategy is timed again only in the buckets up to the
+    one it was pruned in, and is unpruned if it is no longer too slow there
+
+    once a bucket is decided a call costs one dict lookup, plus counting
+    """
+
+    def __init__(self, strategies: Dict[str, Callable[[Any], Any]], size: Callable[[Any], int] = len,
+                 samples: int = 3, recheck_every: int = 10_000, prune_factor: float = 20.0) -> None:
+        self._strategies = dict(strategies)
+        self._size = size
+        self._samples = samples
+        self._recheck_every = recheck_every
+        self._prune_factor = prune_factor
+        # bucket -> chosen strategy
+        self._choices: Dict[int, Callable[[Any], Any]] = {}
+        self._calls = 0
+        self._next_check = recheck_every
+        # bucket -> strategy name -> seconds of every sample
+        self.timings: Dict[int, Dict[str, List[float]]] = {}
+        self.decisions: Dict[int, str] = {}
+        self.history: List[Tuple[int, str]] = []
+        self._pruned: Dict[str, int] = {}
+
+    def __call__(self, data: Any) -> Any:
+        bucket = self._size(data).bit_length()
+        strategy = self._choices.get(bucket)
+        self._calls += 1
+        if strategy is not None and self._calls < self._next_check:
+            return strategy(data)
+        if self._calls >= self._next_check:
+            # time to look again at every bucket. pruned strategies are only timed again
+            # on inputs no bigger than where they were pruned, so a recheck stays cheap
+            self._next_check = self._calls + self._recheck_every
+            self._choices.clear()
+            self.timings.clear()
+        return self._sample(bucket, data)
+
+    def _candidates(self, bucket: int) -> List[str]:
+        names = [name for name in self._strategies
+                 if name not in self._pruned or bucket <= self._pruned[name]]
+        if not names:
+            # every strategy was pruned below this size: keep the one that won closest to it
+            below = [decided for decided in self.decisions if decided < bucket]
+            names = [self.decisions[max(below)] if below else self.history[-1][1]]
+        return names
+
+    def _sample(self, bucket: int, data: Any) -> Any:
+        names = self._candidates(bucket)
+        timings = self.timings.setdefault(bucket, {})
+        result = None
+        for name in names:
+            start = perf_counter()
+            result = self._strategies[name](data)
+            timings.setdefault(name, []).append(perf_counter() - start)
+
+        # strategies pruned since they were last sampled here don't hold the decision up
+        if all(len(timings[name]) >= self._samples for name in names):
+            best = {name: min(timings[name]) for name in names}
+            name = min(best, key=best.get)
+            for other, seconds in best.items():
+                slow = seconds > self._prune_factor * best[name]
+                if slow and other not in self._pruned:
+                    self._pruned[other] = bucket
+                elif not slow and self._pruned.get(other) == bucket:
+                    # caught up again where it was pruned, bigger inputs may try it again
+                    del self._pruned[other]
+            self._choices[bucket] = self._strategies[name]
+            self.decisions[bucket] = name
+            self.history.append((bucket, name))
+        return result
+
+    def choice(self, data: Any) -> Optional[str]:
+        """ the name of the strategy decided for inputs like data, if any """
+        return self.decisions.get(self._size(data).bit_length())
+
+"""
+the four ways of building a list from python_topics/decorators/decorators_action.py,
+as interchangeable strategies
+"""
+
+def make_list1(n: int) -> List[int]:
+    return list(range(n))
+
+def make_list2(n: int) -> List[int]:
+    return [l for l in range(n)]
+
+def make_list3(n: int) -> List[int]:
+    my_list = []
+    for item in range(n):
+        my_list.append(item)
+    return my_list
+
+def make_list4(n: int) -> List[int]:
+    my_list = []
+    for item in range(n):
+        my_list = my_list + [item]
+    return my_list
+
+class ListBuilder(Strategy):
+    """ the classic form: a strategy object wrapping one of the builders """
+    def __init__(self, build: Callable[[int], List[int]]) -> None:
+        self._build = build
+
+    def execute(self, data: int) -> List[int]:
+        return self._build(data)
+
+def main() -> None:
+    context = AdaptiveContext(
+        {builder.__name__: ListBuilder(builder).execute
+         for builder in (make_list1, make_list2, make_list3, make_list4)},
+        size=lambda n: n)
+    for n in (10, 100, 1_000, 10_000, 100_000):
+        for _ in range(5):
+            context(n)
+        print(f"n = {n:7d}: {context.choice(n)}")
+
+    print("Timings (best of the samples) per bucket:")
+    for bucket, timings in sorted(context.timings.items()):
+        print(bucket, {name: f"{min(seconds):.6f}" for name, seconds in timings.items()})
+
+    start = perf_counter()
+    for _ in range(100_000):
+        context(10)
+    print(f"Steady state: {(perf_counter() - start) / 100_000 * 1e9:.0f} ns per call")
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,17 @@
 # without changing its structure
 
 from abc import ABC, abstractmethod
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+def _noop(self) -> None:
+    pass
+
+def _is_noop(step: Callable[[Any], Any]) -> bool:
+    # compiled by this interpreter to the same bytecode and constants as `pass` above,
+    # so a step returning a constant, or with a docstring, is never taken for a no-op
+    code, noop = getattr(step, '__code__', None), _noop.__code__
+    return code is not None and code.co_code == noop.co_code and code.co_consts == noop.co_consts
 
 class AbstractClass(ABC):
     """
@@ -13,17 +24,86 @@ class AbstractClass(ABC):
     intact
     """
 
-    def template_method(self) -> None:
+    # the skeleton of the algorithm, as the names of its steps in order
+    _steps: Tuple[str, ...] = (
+        'base_operation1',
+        'required_operations1',
+        'base_operation2',
+        'hook1',
+        'required_operations2',
+        'base_operation3',
+        'hook2',
+    )
+
+    # the steps of a class resolved once into plain functions, leaving out the steps that
+    # do nothing (hooks it doesn't override, operations reduced to `pass`).
+    # built for every subclass when the class is created
+    _plan: Tuple[Callable[[Any], None], ...] = ()
+
+    # the same for template_method_many: (name, step, batch step or None) for every step
+    _batch_plan: Tuple[Tuple[str, Callable[[Any], Any], Optional[Callable[[Any, Any], Any]]], ...] = ()
+
+    # the item the algorithm currently works on, for steps that need one
+    item: Any = None
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._plan = tuple(getattr(cls, name) for name in cls._steps if not _is_noop(getattr(cls, name)))
+        cls._batch_plan = tuple(
+            (name, getattr(cls, name), getattr(cls, name + '_many', None)) for name in cls._steps
+            if not (_is_noop(getattr(cls, name)) and not hasattr(cls, name + '_many'))
+        )
+        # step name -> [calls, items, seconds], for template_method_many of this class only
+        cls._timings: Dict[str, List[float]] = {name: [0, 0, 0.0] for name, _, _ in cls._batch_plan}
+
+    def template_method(self) -> Any:
+        """
+        the template method defines the skeleton of the algorithm. it runs the compiled plan
+        of the class, so steps replaced on an instance rather than a subclass are not seen.
+        like in template_method_many, a step returning something other than None replaces
+        `self.item`, which is returned at the end
+        """
+        for step in self._plan:
+            result = step(self)
+            if result is not None:
+                self.item = result
+        return self.item
+
+    def template_method_many(self, items: Sequence[Any]) -> Sequence[Any]:
+        """
+        runs the algorithm over many items, one step at a time for all of them.
+        a step `name` can provide `name_many(items)` working on the whole list (or array)
+        at once; other steps are called once per item, with the item in `self.item`.
+        a step returning something other than None replaces the items for the next steps,
+        and the final items are returned
+        """
+        timings, current = self._timings, self.item
+        for name, step, batch in self._batch_plan:
+            start = perf_counter()
+            if batch is not None:
+                result = batch(self, items)
+                if result is not None:
+                    items = result
+            else:
+                results = []
+                for item in items:
+                    self.item = item
+                    result = step(self)
+                    results.append(item if result is None else result)
+                items = results
+            timing = timings[name]
+            timing[0] += 1
+            timing[1] += len(items)
+            timing[2] += perf_counter() - start
+        self.item = current
+        return items
+
+    @classmethod
+    def step_timings(cls) -> Dict[str, Tuple[int, int, float]]:
         """
-        the template method defines the skeleton of the algorithm
+        per step of this class: batches run, items processed and seconds spent
         """
-        self.base_operation1()
-        self.required_operations1()
-        self.base_operation2()
-        self.hook1()
-        self.required_operations2()
-        self.base_operation3()
-        self.hook2()
+        return {name: tuple(timing) for name, timing in cls._timings.items()}
 
     def base_operation1(self) -> None:
         print("AbstractClass: I am doing bulk of the work")
@@ -78,6 +158,35 @@ class ConcreteClass2(AbstractClass):
     def hook1(self) -> None:
         print("ConcreteClass2: Overridden hook1")
 
+class SquareClass(AbstractClass):
+    """
+    a numeric algorithm: the item is a number, and the required operations can
+    also work on a whole batch at once. it has nothing to say in the base operations,
+    so they are left out of its plans
+    """
+
+    def __init__(self, item: Any = None) -> None:
+        self.item = item
+
+    def base_operation1(self) -> None:
+        pass
+
+    def base_operation2(self) -> None:
+        pass
+
+    def base_operation3(self) -> None:
+        pass
+
+    def required_operations1(self) -> Any:
+        return self.item * self.item
+
+    def required_operations1_many(self, items: Sequence[Any]) -> Sequence[Any]:
+        # works on a list, and on a numpy array without change
+        return items * items if not isinstance(items, list) else [item * item for item in items]
+
+    def required_operations2(self) -> Any:
+        return self.item + 1
+
 def client_code(abstract_class: AbstractClass) -> None:
     """
     the client code calls the template method to execute the algorithm. Client code
@@ -92,3 +201,10 @@ if __name__ == "__main__":
     client_code(ConcreteClass1())
     print("\n")
     client_code(ConcreteClass2())
+
+    print("\n")
+    print(f"SquareClass(3).template_method(): {SquareClass(3).template_method()}")
+    squares = SquareClass().template_method_many(list(range(100_000)))
+    print(f"SquareClass: {squares[:5]} ...")
+    for name, (batches, items, seconds) in SquareClass.step_timings().items():
+        print(f"{name:22s} {batches} batch, {items} items, {seconds:.4f}s")
@@ -0,0 +1,220 @@
+# behavioral design pattern that separates an algorithm from the objects it works on
+
+# every element accepts a visitor and calls the visitor's method for its own class
+# (double dispatch). on deep object graphs, walking by recursion runs out of stack,
+# and looking up "visit_" + class name on every node adds up, so the framework below
+# caches the lookup per visitor class and walks with an explicit stack
+
+from __future__ import annotations
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Sequence
+
+class Element:
+    """
+    an element of the object graph. subclasses list their children in `children`
+    """
+    __slots__ = ('children',)
+
+    def __init__(self, children: Sequence[Element] = ()) -> None:
+        self.children = children
+
+    def accept(self, visitor: Visitor) -> Any:
+        return visitor.visit(self)
+
+class Number(Element):
+    __slots__ = ('value',)
+
+    def __init__(self, value: float) -> None:
+        super().__init__()
+        self.value = value
+
+class Add(Element):
+    __slots__ = ()
+
+class Multiply(Element):
+    __slots__ = ()
+
+# returned by a pre-order visit method to skip the children of the node
+SKIP = object()
+
+class Visitor:
+    """
+    visit(node) calls visit_<class name> for the class of the node, or for its closest base
+    class that has one, and generic_visit otherwise. the method found for a class is cached
+    per visitor class, so it is looked up once per class instead of once per node.
+
+    walk() visits a whole tree without recursion, in pre or post order
+    """
+
+    _dispatch: Dict[type, Callable[[Visitor, Element], Any]] = {}
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._dispatch = {}
+
+    @classmethod
+    def _resolve(cls, node_type: type) -> Callable[[Visitor, Element], Any]:
+        for klass in node_type.__mro__:
+            method = getattr(cls, 'visit_' + klass.__name__, None)
+            if method is not None:
+                break
+        else:
+            method = cls.generic_visit
+        cls._dispatch[node_type] = method
+        return method
+
+    def visit(self, node: Element) -> Any:
+        method = self._dispatch.get(type(node)) or self._resolve(type(node))
+        return method(self, node)
+
+    def generic_visit(self, node: Element) -> Any:
+        return None
+
+    def walk(self, root: Element, order: str = 'pre') -> None:
+        """
+        visits every node under root. in pre order a visit method can return SKIP to prune
+        the children of its node. in post order the children are visited before their parent
+        """
+        dispatch, resolve = self._dispatch, self._resolve
+        if order == 'pre':
+            stack = [root]
+            pop, extend = stack.pop, stack.extend
+            while stack:
+                node = pop()
+                method = dispatch.get(type(node)) or resolve(type(node))
+                if method(self, node) is not SKIP and node.children:
+                    # reversed, so the first child is visited first
+                    extend(reversed(node.children))
+        elif order == 'post':
+            # every node goes on the stack twice: to expand it, then to visit it
+            stack: List[Any] = [(root, False)]
+            pop, append = stack.pop, stack.append
+            while stack:
+                node, expanded = pop()
+                if expanded or not node.children:
+                    method = dispatch.get(type(node)) or resolve(type(node))
+                    method(self, node)
+                else:
+                    append((node, True))
+                    for child in reversed(node.children):
+                        append((child, False))
+        else:
+            raise ValueError(f"order must be 'pre' or 'post', not {order!r}")
+
+class Evaluator(Visitor):
+    """
+    evaluates an expression tree in post order, keeping the intermediate values on a stack
+    """
+    def __init__(self) -> None:
+        self._values: List[float] = []
+
+    def visit_Number(self, node: Number) -> None:
+        self._values.append(node.value)
+
+    def _operands(self, node: Element) -> List[float]:
+        # the values of the children are the last ones on the stack
+        values = self._values
+        start = len(values) - len(node.children)
+        operands = values[start:]
+        del values[start:]
+        return operands
+
+    def visit_Add(self, node: Add) -> None:
+        self._values.append(sum(self._operands(node)))
+
+    def visit_Multiply(self, node: Multiply) -> None:
+        product = 1
+        for value in self._operands(node):
+            product *= value
+        self._values.append(product)
+
+    def evaluate(self, root: Element) -> float:
+        self._values = []
+        self.walk(root, 'post')
+        return self._values.pop()
+
+class NodeCounter(Visitor):
+    """ counts the nodes, without looking inside multiplications when asked to """
+    def __init__(self, skip_multiply: bool = False) -> None:
+        self.count = 0
+        self._skip_multiply = skip_multiply
+
+    def generic_visit(self, node: Element) -> Any:
+        self.count += 1
+
+    def visit_Multiply(self, node: Multiply) -> Any:
+        self.count += 1
+        if self._skip_multiply:
+            return SKIP
+
+class RecursiveCounter:
+    """ the naive visitor: recursion and a getattr per node """
+    def __init__(self) -> None:
+        self.count = 0
+
+    def visit(self, node: Element) -> None:
+        getattr(self, 'visit_' + type(node).__name__, self.generic_visit)(node)
+
+    def generic_visit(self, node: Element) -> None:
+        self.count += 1
+        for child in node.children:
+            self.visit(child)
+
+def build_tree(nodes: int, fanout: int = 4) -> Element:
+    """ a balanced tree of additions with `nodes` nodes in total """
+    root = Add([])
+    frontier = [root]
+    made = 1
+    # the loop also reaches the parents appended to frontier while it runs
+    for parent in frontier:
+        if made >= nodes:
+            break
+        children = []
+        for _ in range(min(fanout, nodes - made)):
+            child = Add([]) if made % 3 else Number(made)
+            children.append(child)
+            made += 1
+        parent.children = children
+        frontier.extend(child for child in children if isinstance(child, Add))
+    return root
+
+def build_chain(depth: int) -> Element:
+    """ a degenerate tree, one node deep per level """
+    node: Element = Number(1)
+    for _ in range(depth):
+        node = Add([node])
+    return node
+
+def benchmark(nodes: int = 1_000_000) -> None:
+    tree = build_tree(nodes)
+
+    counter = NodeCounter()
+    start = perf_counter()
+    counter.walk(tree)
+    walked = perf_counter() - start
+
+    naive = RecursiveCounter()
+    start = perf_counter()
+    naive.visit(tree)
+    recursed = perf_counter() - start
+
+    print(f"cached dispatch, explicit stack: {counter.count / walked:12.0f} nodes/s")
+    print(f"getattr dispatch, recursion:     {naive.count / recursed:12.0f} nodes/s")
+
+def main() -> None:
+    # (1 + 2) * (3 + 4)
+    expression = Multiply([Add([Number(1), Number(2)]), Add([Number(3), Number(4)])])
+    print(f"Evaluator: {Evaluator().evaluate(expression)}")
+
+    counter = NodeCounter(skip_multiply=True)
+    counter.walk(Add([expression, Number(5)]))
+    print(f"NodeCounter, pruning below multiplications: {counter.count}")
+
+    counter = NodeCounter()
+    counter.walk(build_chain(100_000))
+    print(f"NodeCounter on a chain 100000 deep: {counter.count}")
+
+    benchmark()
+
+if __name__ == "__main__":
+    main()
@@ -19,10 +19,19 @@ This particular implementation abstracts the creation of a pet and does so depen
 Provides a way to encapsulate a group of individual factories
 """
 
+import importlib
+import io
+import os
 import random
-from typing import Type
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, TextIO, Type
 
 class Pet:
+    # no per instance __dict__, a pet only stores its name
+    __slots__ = ('name',)
+
     def __init__(self, name: str) -> None:
         self.name = name
     
@@ -33,6 +42,8 @@ class Pet:
         raise NotImplementedError
 
 class Dog(Pet):
+    __slots__ = ()
+
     def speak(self) -> None:
         print("woof")
 
@@ -40,6 +51,8 @@ class Dog(Pet):
         return f"Dog<{self.name}>"
 
 class Cat(Pet):
+    __slots__ = ()
+
     def speak(self) -> None:
         print("meow")
     
@@ -55,9 +68,134 @@ class PetShop:
         print(f"Here is your lovely {pet}")
         return pet
 
+    def buy_pets(self, names: Sequence[str], out: Optional[TextIO] = None) -> List[Pet]:
+        """
+        creates a pet for every name at once. a factory with a `bulk` attribute
+        (like random_animal) is asked for all the pets in one call. the announcements are
+        joined and written to `out` (stdout by default) in one go instead of one print per pet
+        """
+        bulk = getattr(self.pet_factory, 'bulk', None)
+        if bulk is not None:
+            pets = bulk(names)
+        else:
+            factory = self.pet_factory
+            pets = [factory(name) for name in names]
+        if pets:
+            (out if out is not None else sys.stdout).write(
+                "".join([f"Here is your lovely {pet}\n" for pet in pets]))
+        return pets
+
 def random_animal(name: str) -> Pet:
     return random.choice([Dog, Cat])(name)
 
+def _random_animals(names: Iterable[str]) -> List[Pet]:
+    # draws the species of all the pets in one call, names may be any iterable
+    names = list(names)
+    species = random.choices([Dog, Cat], k=len(names))
+    return [kind(name) for kind, name in zip(species, names)]
+
+random_animal.bulk = _random_animals
+
+class FactoryRegistry:
+    """
+    maps names to factories given as "module:callable" strings. nothing is imported
+    until a factory is first used, then the resolved callable is cached, so having dozens of
+    product families registered costs nothing at startup. warm_up() preloads some of
+    them on a background thread once the application is up
+    """
+
+    def __init__(self, factories: Optional[Dict[str, str]] = None) -> None:
+        self._paths: Dict[str, str] = {}
+        self._resolved: Dict[str, Callable[..., Any]] = {}
+        self._lock = threading.Lock()
+        for name, path in (factories or {}).items():
+            self.register(name, path)
+
+    def register(self, name: str, path: str) -> None:
+        module_name, _, attribute = path.partition(":")
+        if not module_name or not attribute:
+            raise ValueError(f'expected "module:callable", got {path!r}')
+        with self._lock:
+            self._paths[name] = path
+            self._resolved.pop(name, None)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._paths
+
+    def get(self, name: str) -> Callable[..., Any]:
+        factory = self._resolved.get(name)
+        if factory is not None:
+            return factory
+        with self._lock:
+            factory = self._resolved.get(name)
+            if factory is None:
+                module_name, _, attribute = self._paths[name].partition(":")
+                factory = importlib.import_module(module_name)
+                for part in attribute.split("."):
+                    factory = getattr(factory, part)
+                self._resolved[name] = factory
+        return factory
+
+    def lazy(self, name: str) -> Callable[..., Any]:
+        """
+        a stand-in callable that resolves the factory on its first call, e.g. for PetShop
+        """
+        if name not in self._paths:
+            raise KeyError(name)
+
+        def factory(*args: Any, **kwargs: Any) -> Any:
+            return self.get(name)(*args, **kwargs)
+
+        factory.__name__ = name
+        return factory
+
+    def warm_up(self, names: Optional[Iterable[str]] = None) -> threading.Thread:
+        """
+        resolves the named factories (all of them by default) on a daemon thread
+        """
+        names = list(self._paths if names is None else names)
+
+        def resolve() -> None:
+            for name in names:
+                self.get(name)
+
+        thread = threading.Thread(target=resolve, name="factory-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+# stdlib modules standing in for the modules of heavy product families
+_HEAVY_FACTORIES = {
+    "decimal": "decimal:Decimal",
+    "fraction": "fractions:Fraction",
+    "document": "xml.dom.minidom:Document",
+    "message": "email.mime.text:MIMEText",
+    "connection": "http.client:HTTPConnection",
+    "archive": "tarfile:TarFile",
+    "pool": "multiprocessing.pool:ThreadPool",
+}
+
+def startup_benchmark(runs: int = 5) -> None:
+    """
+    time to start a fresh interpreter that registers the factories above,
+    importing them up front or lazily
+    """
+    import subprocess
+
+    registry = f"import sys; sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r}); " \
+               f"from abstract_factory import FactoryRegistry, _HEAVY_FACTORIES; " \
+               f"registry = FactoryRegistry(_HEAVY_FACTORIES)"
+    programs = {
+        "eager": registry + "; [registry.get(name) for name in _HEAVY_FACTORIES]",
+        "lazy": registry,
+    }
+    for label, program in programs.items():
+        best = float("inf")
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", program], check=True)
+            best = min(best, time.perf_counter() - start)
+        print(f"{label:5s} startup: {best * 1000:.1f} ms")
+
 def main() -> None:
     shop = PetShop(random_animal)
     for name in ["Max", "Jack", "Buddy"]:
@@ -65,6 +203,19 @@ def main() -> None:
         pet.speak()
         print("=" * 20)
 
+    pets = shop.buy_pets(["Bella", "Luna", "Charlie"])
+    print(f"Bought {len(pets)} pets in bulk")
+
+    # the announcements of many pets go to an in-memory sink instead
+    pets = PetShop(Dog).buy_pets([f"Dog{i}" for i in range(100_000)], out=io.StringIO())
+    print(f"Bought {len(pets)} dogs in bulk, {sys.getsizeof(pets[0])} bytes each")
+
+    registry = FactoryRegistry({"dog": f"{__name__}:Dog", "cat": f"{__name__}:Cat"})
+    registry.warm_up(["cat"]).join()
+    shop = PetShop(registry.lazy("dog"))
+    shop.buy_pet("Rex").speak()
+    startup_benchmark()
+
 if __name__ == "__main__":
     random.seed(568)
     main()
\ No newline at end of file
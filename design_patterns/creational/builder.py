@@ -6,10 +6,20 @@
 # builder pattern solves the issue by segregating the entire process into 4 roles:
 # 1. The product
 
+from __future__ import annotations
 from abc import ABC, abstractmethod
+from array import array
+from collections.abc import Sequence
+from functools import lru_cache
+from time import perf_counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import tracemalloc
 
 class Car:
     """ The Product """
+    # a car only holds these three fields, so it needs no per instance __dict__
+    __slots__ = ('autonomous_driving', 'sunroof', 'fuel')
+
     def __init__(self) -> None:
         self.autonomous_driving = None
         self.sunroof = None
@@ -20,6 +30,42 @@ class Car:
         f'Sunroof: {self.sunroof} | Fuel: {self.fuel}')
         return output
 
+class FrozenCar(Car):
+    """
+    an immutable, hashable Car. identical configurations can share one instance (flyweight).
+    it is still a Car, so code checking isinstance(car, Car) takes it as before
+    """
+    # the fields are the slots of Car
+    __slots__ = ()
+
+    def __init__(self, autonomous_driving: Any, sunroof: Any, fuel: Any) -> None:
+        object.__setattr__(self, 'autonomous_driving', autonomous_driving)
+        object.__setattr__(self, 'sunroof', sunroof)
+        object.__setattr__(self, 'fuel', fuel)
+
+    @classmethod
+    def from_car(cls, car: Car) -> FrozenCar:
+        return cls(car.autonomous_driving, car.sunroof, car.fuel)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def _key(self) -> Tuple[Any, Any, Any]:
+        return (self.autonomous_driving, self.sunroof, self.fuel)
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, FrozenCar):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    __str__ = Car.__str__
+
 # 2. Abstract builder interface
 class AbstractCarBuilder(ABC):
     def __init__(self) -> None:
@@ -58,21 +104,158 @@ class ConcreteCarBuilder(AbstractCarBuilder):
 # director uses a concrete builder object
 
 class Director:
-    def __init__(self, builder : AbstractCarBuilder):
+    """
+    with intern=True, construct_car returns a shared FrozenCar for configurations it has
+    already built, kept in an LRU cache of `intern_size` configurations. the builder
+    steps only run (and validate) when a configuration is built for the first time.
+    the cache is typed, so construct_car(1, 0) and construct_car(True, False) are different cars
+    """
+    def __init__(self, builder : AbstractCarBuilder, intern: bool = False, intern_size: int = 1024):
         self._builder = builder
+        self._interned = (lru_cache(maxsize=intern_size, typed=True)(self._construct_frozen)
+                          if intern else None)
     
     def construct_car(self, autonomous_driving = False, sun_roof = False, fuel = 'Electric'):
+        if self._interned is not None:
+            return self._interned(autonomous_driving, sun_roof, fuel)
+        return self._construct(autonomous_driving, sun_roof, fuel)
+
+    def _construct_frozen(self, autonomous_driving, sun_roof, fuel) -> FrozenCar:
+        return FrozenCar.from_car(self._construct(autonomous_driving, sun_roof, fuel))
+
+    def intern_stats(self) -> Dict[str, float]:
+        """ hits, misses, size and hit rate of the intern cache """
+        if self._interned is None:
+            return {}
+        info = self._interned.cache_info()
+        calls = info.hits + info.misses
+        return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize,
+                'maxsize': info.maxsize, 'hit_rate': info.hits / calls if calls else 0.0}
+
+    def _construct(self, autonomous_driving, sun_roof, fuel):
         self._builder.create_new_car()
         self._builder.add_autonomous_driving(autonomous_driving)
         self._builder.add_sun_roof(sun_roof)
         self._builder.add_fuel(fuel)
         return self._builder.car
 
+    def construct_many(self, specs: Optional[Iterable[Tuple[bool, bool, str]]] = None, *,
+                       autonomous_driving: Optional[Sequence] = None,
+                       sun_roof: Optional[Sequence] = None,
+                       fuel: Optional[Sequence] = None) -> CarFleet:
+        """
+        builds many cars at once, from (autonomous_driving, sun_roof, fuel) specs or from
+        the three columns, into a columnar CarFleet. the builder steps still validate:
+        they run once on a new car for every distinct configuration of the batch, so checks
+        across fields only see combinations that are really asked for
+        """
+        if specs is not None:
+            columns = list(zip(*specs)) or [(), (), ()]
+            autonomous_driving, sun_roof, fuel = columns
+        if not (len(autonomous_driving) == len(sun_roof) == len(fuel)):
+            raise ValueError('the columns must have the same length')
+
+        for configuration in set(zip(autonomous_driving, sun_roof, fuel)):
+            self._construct(*configuration)
+
+        fuels: Dict[str, int] = {}
+        codes = [fuels.setdefault(value, len(fuels)) for value in fuel]
+        return CarFleet(_flags(autonomous_driving), _flags(sun_roof),
+                        array('B' if len(fuels) <= 256 else 'I', codes), list(fuels))
+
+# how the flag columns store None, the default of a Car that was never configured
+_UNSET = -1
+
+def _flags(values: Sequence) -> array:
+    return array('b', [_UNSET if value is None else bool(value) for value in values])
+
+def _flag(code: int) -> Optional[bool]:
+    return None if code == _UNSET else bool(code)
+
+class CarFleet(Sequence):
+    """
+    many cars stored by column: two arrays of flags (-1 standing for None) and a dictionary
+    encoded fuel column (a small code per car, and the list of distinct fuels). indexing gives a CarView
+    that reads the columns, no Car is created unless asked for with to_car()
+    """
+
+    def __init__(self, autonomous_driving: array, sunroof: array, fuel_codes: array,
+                 fuels: List[str]) -> None:
+        self.autonomous_driving = autonomous_driving
+        self.sunroof = sunroof
+        self.fuel_codes = fuel_codes
+        self.fuels = fuels
+
+    def __len__(self) -> int:
+        return len(self.fuel_codes)
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[CarView, CarFleet]:
+        if isinstance(i, slice):
+            return CarFleet(self.autonomous_driving[i], self.sunroof[i], self.fuel_codes[i], self.fuels)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('car index out of range')
+        return CarView(self, i)
+
+    def count_fuel(self, fuel: str) -> int:
+        """ number of cars with a fuel, counted on the codes """
+        if fuel not in self.fuels:
+            return 0
+        return self.fuel_codes.count(self.fuels.index(fuel))
+
+class CarView:
+    """ a read only Car backed by one row of a CarFleet """
+    __slots__ = ('_fleet', '_index')
+
+    def __init__(self, fleet: CarFleet, index: int) -> None:
+        self._fleet = fleet
+        self._index = index
+
+    @property
+    def autonomous_driving(self) -> Optional[bool]:
+        return _flag(self._fleet.autonomous_driving[self._index])
+
+    @property
+    def sunroof(self) -> Optional[bool]:
+        return _flag(self._fleet.sunroof[self._index])
+
+    @property
+    def fuel(self) -> str:
+        return self._fleet.fuels[self._fleet.fuel_codes[self._index]]
+
+    def to_car(self) -> Car:
+        car = Car()
+        car.autonomous_driving = self.autonomous_driving
+        car.sunroof = self.sunroof
+        car.fuel = self.fuel
+        return car
+
+    __str__ = Car.__str__
+
 def main():
     concreteCarBuilder = ConcreteCarBuilder()
     director = Director(concreteCarBuilder)
     model_one = director.construct_car(True, True, 'Diesel')
     print(model_one)
 
+    fleet = director.construct_many(
+        (i % 2 == 0, i % 3 == 0, ('Electric', 'Diesel', 'Petrol')[i % 3]) for i in range(1_000_000))
+    print(f"Fleet of {len(fleet)} cars, {fleet.count_fuel('Electric')} electric")
+    print(fleet[-1])
+
+    for intern in (False, True):
+        director = Director(ConcreteCarBuilder(), intern=intern)
+        tracemalloc.start()
+        start = perf_counter()
+        cars = [director.construct_car(i % 2 == 0, i % 3 == 0, ('Electric', 'Diesel')[i % 2])
+                for i in range(1_000_000)]
+        elapsed = perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"intern={intern}: {len(cars)} cars in {elapsed:.3f}s, peak memory {peak / 10 ** 6:.1f} MB")
+        del cars
+    print(director.intern_stats())
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
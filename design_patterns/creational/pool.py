@@ -1,4 +1,10 @@
+import asyncio
+import inspect
 import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
 
 class ObjectPool:
     def __init__(self, queue, auto_get = False) -> None:
@@ -20,6 +26,661 @@ class ObjectPool:
             self._queue.put(self.item)
             self.item = None
 
+class _Entry:
+    """ a pooled object and its timestamps """
+    __slots__ = ('obj', 'created', 'released')
+
+    def __init__(self, obj: Any) -> None:
+        self.obj = obj
+        self.created = self.released = time.monotonic()
+
+class _Lease:
+    """
+    what ResourcePool.acquire returns: checks an object out on enter and returns it on exit,
+    so it is used like ObjectPool. an exception inside the block marks the object as broken
+    when the pool is told to (discard_on_error)
+    """
+
+    def __init__(self, pool: 'ResourcePool', timeout: Optional[float]) -> None:
+        self._pool = pool
+        self._timeout = timeout
+        self.item = None
+
+    def __enter__(self):
+        self.item = self._pool.get(self._timeout)
+        return self.item
+
+    def __exit__(self, Type, value, traceback):
+        item, self.item = self.item, None
+        self._pool.put(item, broken=Type is not None and self._pool.discard_on_error)
+
+class ResourcePool:
+    """
+    a thread safe pool creating its objects with `factory`, between min_size and max_size of them.
+
+    - get() waits at most `timeout` seconds for an object, then raises TimeoutError
+    - idle objects older than max_idle seconds, and any object older than max_lifetime
+      seconds, are closed instead of being handed out
+    - `check(obj)` runs on checkout, an object failing it (or making it raise) is closed
+      and replaced
+    - `close(obj)` is called on every object leaving the pool
+
+    objects go back to the pool explicitly (put, or the end of an acquire() block),
+    never from __del__, so it is always clear when an object is free again
+    """
+
+    def __init__(self, factory: Callable[[], Any], min_size: int = 0, max_size: int = 10,
+                 timeout: Optional[float] = None, max_idle: Optional[float] = None,
+                 max_lifetime: Optional[float] = None, check: Optional[Callable[[Any], bool]] = None,
+                 close: Optional[Callable[[Any], None]] = None, discard_on_error: bool = False) -> None:
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError('expected 0 <= min_size <= max_size and max_size >= 1')
+        self._factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self._check = check
+        self._close = close
+        self.discard_on_error = discard_on_error
+
+        self._lock = threading.Condition()
+        self._idle: Deque[_Entry] = deque()
+        self._in_use: Dict[int, _Entry] = {}
+        # objects alive plus the ones being created
+        self._size = 0
+        self._closed = False
+
+        self.created = 0
+        self.destroyed = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.broken = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+        self._fill()
+
+    def acquire(self, timeout: Optional[float] = None) -> _Lease:
+        """ `with pool.acquire() as obj:` """
+        return _Lease(self, timeout)
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return ((self.max_lifetime is not None and now - entry.created > self.max_lifetime) or
+                (self.max_idle is not None and now - entry.released > self.max_idle))
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        while True:
+            entry, expired, timed_out = None, [], False
+            with self._lock:
+                while True:
+                    if self._closed:
+                        raise RuntimeError('the pool is closed')
+                    now = time.monotonic()
+                    while self._idle:
+                        candidate = self._idle.pop()
+                        if self._expired(candidate, now):
+                            expired.append(candidate)
+                            self._size -= 1
+                        else:
+                            entry = candidate
+                            break
+                    if entry is not None or self._size < self.max_size:
+                        break
+                    remaining = None if deadline is None else deadline - now
+                    if remaining is not None and remaining <= 0:
+                        self.timeouts += 1
+                        timed_out = True
+                        break
+                    self._lock.wait(remaining)
+                if entry is None and not timed_out:
+                    # reserve the slot, the object is created outside the lock
+                    self._size += 1
+            self._destroy_all(expired)
+            if timed_out:
+                raise TimeoutError(f'no object available after {timeout}s')
+
+            if entry is None:
+                try:
+                    entry = _Entry(self._factory())
+                except BaseException:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+                with self._lock:
+                    self.created += 1
+            elif self._check is not None and not self._healthy(entry):
+                with self._lock:
+                    self.broken += 1
+                    self._size -= 1
+                    self._lock.notify()
+                self._destroy(entry)
+                continue
+
+            waited = time.monotonic() - start
+            with self._lock:
+                self._in_use[id(entry.obj)] = entry
+                self.acquired += 1
+                self.total_wait += waited
+                if waited > self.max_wait:
+                    self.max_wait = waited
+            return entry.obj
+
+    def _healthy(self, entry: _Entry) -> bool:
+        # a check that raises (a ping failing with ConnectionError, say) is a failed check
+        try:
+            return bool(self._check(entry.obj))
+        except Exception:
+            return False
+        except BaseException:
+            # interrupted, the object goes back unchecked
+            with self._lock:
+                self._idle.append(entry)
+                self._lock.notify()
+            raise
+
+    def put(self, obj: Any, broken: bool = False) -> None:
+        with self._lock:
+            entry = self._in_use.pop(id(obj), None)
+            if entry is None:
+                raise ValueError(f'{obj!r} is not checked out of this pool')
+            if broken or self._closed:
+                self.broken += broken
+                self._size -= 1
+                self._lock.notify()
+            else:
+                entry.released = time.monotonic()
+                self._idle.append(entry)
+                self._lock.notify()
+                return
+        self._destroy(entry)
+
+    def _destroy(self, entry: _Entry) -> None:
+        with self._lock:
+            self.destroyed += 1
+        if self._close is not None:
+            self._close(entry.obj)
+
+    def _destroy_all(self, entries: list) -> None:
+        for entry in entries:
+            self._destroy(entry)
+
+    def _fill(self) -> None:
+        while True:
+            with self._lock:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                entry = _Entry(self._factory())
+            except BaseException:
+                with self._lock:
+                    self._size -= 1
+                raise
+            with self._lock:
+                self.created += 1
+                self._idle.appendleft(entry)
+                self._lock.notify()
+
+    def evict(self) -> int:
+        """
+        closes the expired idle objects and tops the pool back up to min_size.
+        call it from time to time, objects are otherwise only checked on checkout
+        """
+        with self._lock:
+            now = time.monotonic()
+            expired = [entry for entry in self._idle if self._expired(entry, now)]
+            if expired:
+                self._idle = deque(entry for entry in self._idle if not self._expired(entry, now))
+                self._size -= len(expired)
+                self._lock.notify(len(expired))
+        self._destroy_all(expired)
+        self._fill()
+        return len(expired)
+
+    def close(self) -> None:
+        """ closes the idle objects now, and the others when they come back """
+        with self._lock:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._lock.notify_all()
+        self._destroy_all(idle)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'utilization': len(self._in_use) / self.max_size,
+                'created': self.created,
+                'destroyed': self.destroyed,
+                'acquired': self.acquired,
+                'timeouts': self.timeouts,
+                'broken': self.broken,
+                'mean_wait': self.total_wait / self.acquired if self.acquired else 0.0,
+                'max_wait': self.max_wait,
+            }
+
+async def _maybe_await(function: Callable[..., Any], *args: Any) -> Any:
+    # lets the async pool take plain functions as well as coroutine functions
+    result = function(*args)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+async def _close_resource(obj: Any) -> None:
+    aclose = getattr(obj, 'aclose', None)
+    if aclose is not None:
+        await aclose()
+        return
+    close = getattr(obj, 'close', None)
+    if close is not None:
+        await _maybe_await(close)
+
+class _AsyncLease:
+    """
+    what AsyncObjectPool.acquire returns, the async counterpart of _Lease
+    """
+
+    def __init__(self, pool: 'AsyncObjectPool', timeout: Optional[float]) -> None:
+        self._pool = pool
+        self._timeout = timeout
+        self.item = None
+
+    async def __aenter__(self):
+        self.item = await self._pool.get(self._timeout)
+        return self.item
+
+    async def __aexit__(self, Type, value, traceback):
+        item, self.item = self.item, None
+        await self._pool.put(item, broken=Type is not None and self._pool.discard_on_error)
+
+class AsyncObjectPool:
+    """
+    the asyncio counterpart of ResourcePool, with the same options and `async with pool.acquire()`.
+    factory, check and close may be plain functions or coroutine functions; by default
+    an object leaving the pool is closed with its aclose() or close() method.
+
+    waiters are served first come, first served: a returned object is handed straight
+    to the oldest waiter instead of going back to the idle list, and a freed slot is
+    reserved for it. a handed object goes through the expiry and health checks like an idle
+    one, and is replaced in the same slot when it fails them. a waiter cancelled right after
+    being handed an object or a slot passes it on, and a check that raises or is cancelled
+    never loses its object.
+    `async with AsyncObjectPool(...) as pool` fills the pool up to min_size and closes it after
+    """
+
+    def __init__(self, factory: Callable[[], Any], min_size: int = 0, max_size: int = 10,
+                 timeout: Optional[float] = None, max_idle: Optional[float] = None,
+                 max_lifetime: Optional[float] = None, check: Optional[Callable[[Any], Any]] = None,
+                 close: Optional[Callable[[Any], Any]] = None, discard_on_error: bool = False) -> None:
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError('expected 0 <= min_size <= max_size and max_size >= 1')
+        self._factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self._check = check
+        self._close = close if close is not None else _close_resource
+        self.discard_on_error = discard_on_error
+
+        self._idle: Deque[_Entry] = deque()
+        self._in_use: Dict[int, _Entry] = {}
+        # waiting get() calls, oldest first. each is given an entry, or None to retry
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._size = 0
+        self._closed = False
+
+        self.created = 0
+        self.destroyed = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.broken = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def __aenter__(self) -> 'AsyncObjectPool':
+        await self.fill()
+        return self
+
+    async def __aexit__(self, Type, value, traceback) -> None:
+        await self.close()
+
+    def acquire(self, timeout: Optional[float] = None) -> _AsyncLease:
+        """ `async with pool.acquire() as obj:` """
+        return _AsyncLease(self, timeout)
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return ((self.max_lifetime is not None and now - entry.created > self.max_lifetime) or
+                (self.max_idle is not None and now - entry.released > self.max_idle))
+
+    async def _create(self) -> _Entry:
+        # the slot is already counted in _size
+        try:
+            entry = _Entry(await _maybe_await(self._factory))
+        except BaseException:
+            self._size -= 1
+            self._wake()
+            raise
+        self.created += 1
+        return entry
+
+    async def get(self, timeout: Optional[float] = None) -> Any:
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        while True:
+            if self._closed:
+                raise RuntimeError('the pool is closed')
+            entry = None
+            while self._idle and entry is None:
+                candidate = self._idle.pop()
+                if self._expired(candidate, time.monotonic()):
+                    self._size -= 1
+                    self._wake()
+                    await self._destroy(candidate)
+                else:
+                    entry = candidate
+            if entry is None and self._size < self.max_size and not self._waiters:
+                self._size += 1
+                entry = await self._create()
+            elif entry is None:
+                entry = await self._wait(deadline, timeout)
+                if entry is None:
+                    # a slot was freed and reserved for us by _wake
+                    if self._closed:
+                        self._size -= 1
+                        raise RuntimeError('the pool is closed')
+                    entry = await self._create()
+                elif not await self._usable(entry):
+                    # the object handed to us is expired or broken, its slot is ours to refill
+                    try:
+                        await asyncio.shield(self._destroy(entry))
+                    except BaseException:
+                        self._size -= 1
+                        self._wake()
+                        raise
+                    entry = await self._create()
+            elif not await self._usable(entry):
+                self._size -= 1
+                self._wake()
+                await asyncio.shield(self._destroy(entry))
+                continue
+
+            waited = time.monotonic() - start
+            self._in_use[id(entry.obj)] = entry
+            self.acquired += 1
+            self.total_wait += waited
+            if waited > self.max_wait:
+                self.max_wait = waited
+            return entry.obj
+
+    async def _usable(self, entry: _Entry) -> bool:
+        # what every reused object goes through, from the idle list or handed over by put
+        if self._expired(entry, time.monotonic()):
+            return False
+        if self._check is not None and not await self._healthy(entry):
+            self.broken += 1
+            return False
+        return True
+
+    async def _healthy(self, entry: _Entry) -> bool:
+        # a check that raises is a failed check
+        try:
+            return bool(await _maybe_await(self._check, entry.obj))
+        except Exception:
+            return False
+        except BaseException:
+            # cancelled while checking, the object goes back unchecked
+            self._release(entry)
+            raise
+
+    async def _wait(self, deadline: Optional[float], timeout: Optional[float]) -> Optional[_Entry]:
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            return await asyncio.wait_for(waiter, remaining)
+        except asyncio.TimeoutError:
+            self._pass_on(waiter)
+            self.timeouts += 1
+            raise TimeoutError(f'no object available after {timeout}s') from None
+        except asyncio.CancelledError:
+            self._pass_on(waiter)
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _pass_on(self, waiter: asyncio.Future) -> None:
+        # the waiter gave up, but may have been handed an entry or a slot just before
+        if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+            entry = waiter.result()
+            if entry is not None:
+                self._release(entry)
+            else:
+                self._size -= 1
+                self._wake()
+
+    def _wake(self) -> None:
+        """
+        called after a slot was freed: reserves it for the oldest waiter, which then
+        creates an object in it. the reservation keeps newcomers from taking the slot first
+        """
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._size += 1
+                waiter.set_result(None)
+                return
+
+    def _release(self, entry: _Entry) -> None:
+        entry.released = time.monotonic()
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(entry)
+                return
+        self._idle.append(entry)
+
+    async def put(self, obj: Any, broken: bool = False) -> None:
+        entry = self._in_use.pop(id(obj), None)
+        if entry is None:
+            raise ValueError(f'{obj!r} is not checked out of this pool')
+        if not broken and not self._closed:
+            # no await on this path, so a cancelled task still returns its object
+            self._release(entry)
+            return
+        self.broken += broken
+        self._size -= 1
+        self._wake()
+        await asyncio.shield(self._destroy(entry))
+
+    async def _destroy(self, entry: _Entry) -> None:
+        self.destroyed += 1
+        await _maybe_await(self._close, entry.obj)
+
+    async def fill(self) -> None:
+        """ creates objects until the pool holds min_size of them """
+        while not self._closed and self._size < self.min_size:
+            self._size += 1
+            entry = await self._create()
+            self._release(entry)
+
+    async def evict(self) -> int:
+        """
+        closes the expired idle objects and tops the pool back up to min_size
+        """
+        now = time.monotonic()
+        expired = [entry for entry in self._idle if self._expired(entry, now)]
+        if expired:
+            self._idle = deque(entry for entry in self._idle if not self._expired(entry, now))
+            self._size -= len(expired)
+            for _ in expired:
+                self._wake()
+            for entry in expired:
+                await self._destroy(entry)
+        await self.fill()
+        return len(expired)
+
+    async def close(self) -> None:
+        """ closes the idle objects now, and the others when they come back """
+        self._closed = True
+        idle, self._idle = list(self._idle), deque()
+        self._size -= len(idle)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(RuntimeError('the pool is closed'))
+        for entry in idle:
+            await self._destroy(entry)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'size': self._size,
+            'idle': len(self._idle),
+            'in_use': len(self._in_use),
+            'waiting': len(self._waiters),
+            'utilization': len(self._in_use) / self.max_size,
+            'created': self.created,
+            'destroyed': self.destroyed,
+            'acquired': self.acquired,
+            'timeouts': self.timeouts,
+            'broken': self.broken,
+            'mean_wait': self.total_wait / self.acquired if self.acquired else 0.0,
+            'max_wait': self.max_wait,
+        }
+
+class FakeConnection:
+    """ an async resource, standing in for a database connection """
+    opened = 0
+
+    def __init__(self) -> None:
+        FakeConnection.opened += 1
+        self.number = FakeConnection.opened
+        self.closed = False
+
+    @classmethod
+    async def connect(cls) -> 'FakeConnection':
+        await asyncio.sleep(0.01)
+        return cls()
+
+    async def query(self) -> int:
+        await asyncio.sleep(0.001)
+        return self.number
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+async def async_main() -> None:
+    async with AsyncObjectPool(FakeConnection.connect, min_size=2, max_size=4, timeout=1.0) as pool:
+        async def client() -> int:
+            async with pool.acquire() as connection:
+                return await connection.query()
+
+        results = await asyncio.gather(*(client() for _ in range(100)))
+        print('100 queries over connections {}'.format(sorted(set(results))))
+        print(pool.stats())
+
+async def waiter_scenarios() -> None:
+    """
+    one slot and several waiters: every way of freeing the slot has to reach them in order
+    """
+    calls = [0]
+
+    def factory() -> int:
+        calls[0] += 1
+        if calls[0] == 2:
+            raise ConnectionError('factory failed')
+        return calls[0]
+
+    async def waiter(pool: AsyncObjectPool) -> Any:
+        try:
+            obj = await pool.get()
+        except ConnectionError as error:
+            return error
+        await asyncio.sleep(0)
+        await pool.put(obj)
+        return obj
+
+    # a broken object is returned: the slot goes to the first waiter, then the second
+    pool = AsyncObjectPool(factory, max_size=1, timeout=1.0, close=lambda obj: None)
+    held = await pool.get()
+    waiters = [asyncio.ensure_future(waiter(pool)) for _ in range(3)]
+    await asyncio.sleep(0)
+    await pool.put(held, broken=True)
+    results = await asyncio.gather(*waiters)
+    # the second creation fails, its slot passes to the next waiter
+    assert isinstance(results[0], ConnectionError) and results[1] == results[2] == 3, results
+    assert pool.stats()['size'] == 1, pool.stats()
+
+    # the idle object has expired: whoever finds it frees the slot for the others
+    pool = AsyncObjectPool(lambda: object(), max_size=1, timeout=1.0, max_idle=0.01,
+                           close=lambda obj: asyncio.sleep(0.01))
+    await pool.put(await pool.get())
+    await asyncio.sleep(0.02)
+    results = await asyncio.gather(*(waiter(pool) for _ in range(3)))
+    assert len(results) == 3 and pool.stats()['size'] == 1, pool.stats()
+
+    # a check that raises, or is cancelled, doesn't lose the object or its slot
+    async def check(obj: Any) -> bool:
+        await asyncio.sleep(0.01)
+        raise ConnectionError('ping failed')
+
+    pool = AsyncObjectPool(lambda: object(), max_size=1, timeout=1.0, check=check,
+                           close=lambda obj: None)
+    await pool.put(await pool.get())
+    getter = asyncio.ensure_future(pool.get())
+    await asyncio.sleep(0)
+    getter.cancel()
+    await asyncio.gather(getter, return_exceptions=True)
+    assert pool.stats()['idle'] == 1, pool.stats()
+    await pool.put(await pool.get())
+    assert pool.stats()['size'] == 1 and pool.broken == 1, pool.stats()
+
+    # an object handed straight to a waiter is checked too, and replaced when it fails
+    names = iter(['bad', 'good'])
+    pool = AsyncObjectPool(lambda: next(names), max_size=1, timeout=1.0,
+                           check=lambda obj: obj != 'bad', close=lambda obj: None)
+    held = await pool.get()
+    waiting = asyncio.ensure_future(pool.get())
+    await asyncio.sleep(0)
+    await pool.put(held)
+    assert await waiting == 'good' and pool.broken == 1, pool.stats()
+    assert pool.stats()['size'] == 1, pool.stats()
+    print('waiter scenarios: broken put, expired object, failed factory and check, '
+          'handed over object all pass')
+
+def contention_benchmark(threads: int = 64, rounds: int = 2_000, max_size: int = 8) -> None:
+    """
+    `threads` threads acquiring and releasing from a pool smaller than them
+    """
+    pool = ResourcePool(object, min_size=max_size, max_size=max_size)
+
+    def worker() -> None:
+        for _ in range(rounds):
+            with pool.acquire():
+                pass
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    print(f"{threads} threads: {threads * rounds / elapsed:.0f} acquire/release per second")
+    print(pool.stats())
+
 def main():
     sample_queue = queue.Queue()
     sample_queue.put('lily')
@@ -27,5 +688,26 @@ def main():
     with ObjectPool(sample_queue) as obj:
         print('Inside with: {}'.format(obj))
 
+    flowers = iter(['lily', 'rose', 'tulip'])
+    pool = ResourcePool(lambda: next(flowers), min_size=1, max_size=2, timeout=0.1,
+                        check=lambda flower: flower != 'rose')
+    with pool.acquire() as first, pool.acquire() as second:
+        print('Inside with: {} and {}'.format(first, second))
+        try:
+            pool.get()
+        except TimeoutError as error:
+            print('A third one: {}'.format(error))
+    # rose fails the health check, so it is replaced on the way out of the pool
+    again = [pool.get(), pool.get()]
+    print('Checked out again: {}'.format(' and '.join(again)))
+    for flower in again:
+        pool.put(flower)
+    print(pool.stats())
+
+    contention_benchmark()
+
+    asyncio.run(async_main())
+    asyncio.run(waiter_scenarios())
+
 if __name__ == "__main__":
     main()